@@ -0,0 +1,52 @@
+# Generated by Django 5.2.10 on 2026-10-18 15:11
+
+from django.db import DatabaseError, migrations, models, transaction
+from django.db.models.functions import Lower
+
+
+def backfill_username_lower(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    User.objects.filter(username__isnull=False).update(username_lower=Lower("username"))
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    Postgres: trigram GIN index so substring search is indexed too.
+    Skipped (prefix search only) if pg_trgm can't be enabled.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute(
+                "CREATE INDEX IF NOT EXISTS accounts_user_username_lower_trgm "
+                "ON accounts_user USING gin (username_lower gin_trgm_ops)"
+            )
+    except DatabaseError as e:
+        print(f"⚠️ pg_trgm unavailable, user search stays prefix-only: {e}")
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("DROP INDEX IF EXISTS accounts_user_username_lower_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='username_lower',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30, null=True),
+        ),
+        migrations.RunPython(backfill_username_lower, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
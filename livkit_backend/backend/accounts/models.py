@@ -20,6 +20,15 @@ class User(AbstractBaseUser, PermissionsMixin):
         blank=True
     )
 
+    # 🔹 Lowercased copy of username for indexed search (kept in save())
+    username_lower = models.CharField(
+        max_length=30,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+
 
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='USER')
@@ -32,6 +41,9 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     date_joined = models.DateTimeField(default=timezone.now)
 
+    # 🔹 Bumped on profile saves (username change) → chat list ETags
+    updated_at = models.DateTimeField(auto_now=True)
+
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
 
@@ -42,6 +54,15 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    def save(self, *args, **kwargs):
+        self.username_lower = self.username.lower() if self.username else None
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "username" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "username_lower", "updated_at"}
+
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.email
 
@@ -228,6 +228,15 @@ CHANNEL_LAYERS = {
 
 CELERY_BROKER_URL = REDIS_URL
 
+# Shared cache (membership lookups etc.); local memory when Redis isn't configured
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+    }
+
 
 
 
@@ -243,6 +252,14 @@ MEDIA_ROOT = BASE_DIR / "media"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 
+from chat.celery_schedule import CELERY_BEAT_SCHEDULE as CHAT_BEAT_SCHEDULE
+from streaming.celery_schedule import CELERY_BEAT_SCHEDULE as STREAMING_BEAT_SCHEDULE
+
+CELERY_BEAT_SCHEDULE = {
+    **CHAT_BEAT_SCHEDULE,
+    **STREAMING_BEAT_SCHEDULE,
+}
+
 
 
 
@@ -263,3 +280,81 @@ STRIPE_MINUTES_PRICE_ID =  os.environ.get("STRIPE_MINUTES_PRICE_ID")
 
 AGORA_APP_ID = "9d64feede1574163bbffbf85bb10f8e6"
 AGORA_APP_CERTIFICATE = "f9367fb864d94ed3a0172b7a11c99fa0"
+
+
+
+# =======================
+# CHAT
+# =======================
+# Write-behind message persistence (opt-in).
+# Messages are broadcast immediately and bulk-inserted every flush interval.
+CHAT_WRITE_BEHIND = os.environ.get("CHAT_WRITE_BEHIND", "0") == "1"
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get("CHAT_WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))  # seconds
+CHAT_WRITE_BEHIND_MAX_PENDING = int(os.environ.get("CHAT_WRITE_BEHIND_MAX_PENDING", "5000"))
+
+# Typing indicators: at most one aggregated frame per conversation per window,
+# and "typing" state expires if the client never sends typing.stop.
+CHAT_TYPING_WINDOW = float(os.environ.get("CHAT_TYPING_WINDOW", "1.0"))  # seconds
+CHAT_TYPING_TTL = float(os.environ.get("CHAT_TYPING_TTL", "6.0"))  # seconds
+
+# Membership cache for WS connect / IsConversationMember.
+# Local LRU entries are short-lived so other processes' invalidations land quickly.
+CHAT_MEMBERSHIP_CACHE_TTL = int(os.environ.get("CHAT_MEMBERSHIP_CACHE_TTL", "300"))  # seconds (Redis)
+CHAT_MEMBERSHIP_LOCAL_TTL = float(os.environ.get("CHAT_MEMBERSHIP_LOCAL_TTL", "5"))  # seconds (in-process)
+CHAT_MEMBERSHIP_CACHE_SIZE = int(os.environ.get("CHAT_MEMBERSHIP_CACHE_SIZE", "50000"))
+
+# WebSocket user cache (JWTAuthMiddleware): local LRU → Redis → DB, like
+# the membership cache. Bans / token_version bumps delete the Redis key, so
+# other processes see them within CHAT_USER_LOCAL_TTL.
+CHAT_USER_CACHE_TTL = int(os.environ.get("CHAT_USER_CACHE_TTL", "300"))  # seconds (Redis)
+CHAT_USER_LOCAL_TTL = float(os.environ.get("CHAT_USER_LOCAL_TTL", "5"))  # seconds (in-process)
+CHAT_USER_CACHE_SIZE = int(os.environ.get("CHAT_USER_CACHE_SIZE", "50000"))
+
+# Multiplexed socket (ws/chat/): max conversations one socket can subscribe to
+CHAT_MULTIPLEX_MAX_SUBSCRIPTIONS = int(os.environ.get("CHAT_MULTIPLEX_MAX_SUBSCRIPTIONS", "500"))
+
+# Monthly Postgres partitions for Message (opt-in; MessageReceipt stays a
+# plain table so it keeps its (message, user) unique constraint).
+# Convert once with `manage.py message_partitions --convert`; the daily
+# beat task then pre-creates months ahead and drops expired months
+# (it also runs, setting or not, once the tables are partitioned).
+CHAT_MESSAGE_PARTITIONING = os.environ.get("CHAT_MESSAGE_PARTITIONING", "0") == "1"
+CHAT_PARTITION_MONTHS_AHEAD = int(os.environ.get("CHAT_PARTITION_MONTHS_AHEAD", "3"))
+
+# User search (search_users): hot query prefixes are cached briefly
+CHAT_USER_SEARCH_CACHE_TTL = int(os.environ.get("CHAT_USER_SEARCH_CACHE_TTL", "30"))  # seconds
+
+# Hot chat reads (message history, chat list) build JSON from values_list
+# rows instead of ModelSerializers. Output is identical; 0 = serializers.
+CHAT_FAST_SERIALIZERS = os.environ.get("CHAT_FAST_SERIALIZERS", "1") == "1"
+
+# Image messages: uploads stream to disk, thumbnails (longest side, px)
+# are made in a process pool. 0 workers = inline (tests).
+CHAT_IMAGE_MAX_BYTES = int(os.environ.get("CHAT_IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+CHAT_IMAGE_MAX_PIXELS = int(os.environ.get("CHAT_IMAGE_MAX_PIXELS", str(40_000_000)))
+CHAT_IMAGE_WORKERS = int(os.environ.get("CHAT_IMAGE_WORKERS", "2"))
+CHAT_IMAGE_THUMBNAIL_SIZES = (96, 480)
+
+
+# =======================
+# STREAMING
+# =======================
+# Viewer heartbeats: "off" = load/save LiveViewSession per heartbeat,
+# "redis" = buffer in Redis and bulk-flush (streaming.tasks.flush_viewer_heartbeats),
+# "local" = in-process stand-in for tests / single-process dev.
+STREAM_HEARTBEAT_BUFFER = os.environ.get("STREAM_HEARTBEAT_BUFFER", "off")
+
+# Ending a stream with more active viewers than this settles them in a
+# Celery task (202 + <stream>/settlement/ to poll). 0 = always inline.
+STREAM_SETTLEMENT_ASYNC_THRESHOLD = int(os.environ.get("STREAM_SETTLEMENT_ASYNC_THRESHOLD", "2000"))
+
+# Agora RTC tokens: lifetime, and per-process cache keyed by
+# (channel, uid, role). A cached token is handed out only while it has
+# at least REFRESH_MARGIN seconds left.
+AGORA_TOKEN_TTL = int(os.environ.get("AGORA_TOKEN_TTL", "3600"))  # seconds
+AGORA_TOKEN_REFRESH_MARGIN = int(os.environ.get("AGORA_TOKEN_REFRESH_MARGIN", "1800"))  # seconds
+AGORA_TOKEN_CACHE_SIZE = int(os.environ.get("AGORA_TOKEN_CACHE_SIZE", "10000"))
+
+# Live feed / active streams: one shared snapshot (cache), rebuilt when a
+# stream starts or ends, or at most this old
+STREAM_FEED_CACHE_TTL = int(os.environ.get("STREAM_FEED_CACHE_TTL", "10"))  # seconds
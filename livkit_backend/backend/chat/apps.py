@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        import chat.signals
+        from chat.search import ensure_sqlite_fts
+
+        post_migrate.connect(ensure_sqlite_fts, sender=self)
@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import Conversation, ConversationMember
+
+
+class LocalLRU:
+    """
+    Small thread-safe in-process LRU with per-entry TTL.
+
+    Sits in front of the shared (Redis) cache so hot keys cost no
+    network round-trip. Entries expire after `ttl` seconds, which bounds
+    how stale a process can be after another process invalidates a key.
+    """
+
+    def __init__(self, maxsize=10000, ttl=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --------------------------------------------------
+# MEMBERSHIP CACHE
+# --------------------------------------------------
+# Two entries, both cached locally (LRU) and in Redis:
+#   chat:conv:<conversation>            → type, is_active (or missing)
+#   chat:member:<conversation>:<user>   → is_member, is_banned
+# Negative results are cached too, so a reconnect storm for a missing
+# conversation doesn't reach the DB either.
+
+_local = LocalLRU(
+    maxsize=settings.CHAT_MEMBERSHIP_CACHE_SIZE,
+    ttl=settings.CHAT_MEMBERSHIP_LOCAL_TTL,
+)
+
+
+def conversation_key(conversation_id):
+    return f"chat:conv:{conversation_id}"
+
+
+def member_key(conversation_id, user_id):
+    return f"chat:member:{conversation_id}:{user_id}"
+
+
+def _cached(key, load):
+    value = _local.get(key)
+    if value is not None:
+        return value
+
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        cache.set(key, value, settings.CHAT_MEMBERSHIP_CACHE_TTL)
+
+    _local.set(key, value)
+    return value
+
+
+def _load_conversation(conversation_id):
+    row = (
+        Conversation.objects.filter(id=conversation_id)
+        .values("type", "is_active")
+        .first()
+    )
+    if not row:
+        return {"exists": False}
+    return {"exists": True, **row}
+
+
+def _load_member(conversation_id, user_id):
+    row = (
+        ConversationMember.objects.filter(
+            conversation_id=conversation_id,
+            user_id=user_id,
+        )
+        .values("is_banned")
+        .first()
+    )
+    if not row:
+        return {"is_member": False, "is_banned": False}
+    return {"is_member": True, **row}
+
+
+def get_membership(conversation_id, user_id):
+    """
+    Returns a dict with:
+        exists, type, is_active   (conversation)
+        is_member, is_banned      (this user in it)
+    """
+    conversation = _cached(
+        conversation_key(conversation_id),
+        lambda: _load_conversation(conversation_id),
+    )
+    if not conversation["exists"]:
+        return _combine(conversation, None)
+
+    member = _cached(
+        member_key(conversation_id, user_id),
+        lambda: _load_member(conversation_id, user_id),
+    )
+    return _combine(conversation, member)
+
+
+async def aget_membership(conversation_id, user_id):
+    """
+    Async variant: answers from the local LRU without leaving the event
+    loop; only a local miss hops to a thread for Redis / the DB.
+    """
+    conversation = _local.get(conversation_key(conversation_id))
+    if conversation is not None:
+        if not conversation["exists"]:
+            return _combine(conversation, None)
+
+        member = _local.get(member_key(conversation_id, user_id))
+        if member is not None:
+            return _combine(conversation, member)
+
+    return await database_sync_to_async(get_membership)(conversation_id, user_id)
+
+
+def _combine(conversation, member):
+    return {
+        **conversation,
+        **(member or {"is_member": False, "is_banned": False}),
+    }
+
+
+def invalidate_conversation(conversation_id):
+    key = conversation_key(conversation_id)
+    _local.delete(key)
+    cache.delete(key)
+
+
+def invalidate_member(conversation_id, user_id):
+    key = member_key(conversation_id, user_id)
+    _local.delete(key)
+    cache.delete(key)
+
+
+# --------------------------------------------------
+# WEBSOCKET USER CACHE
+# --------------------------------------------------
+# JWTAuthMiddleware resolves the token's user_id through this cache:
+# local LRU → Redis → DB, like the membership cache. Misses use the
+# native async ORM / cache API, so connect storms don't queue up in the
+# sync thread pool. Invalidated on User save (ban, token_version): the
+# Redis key goes at once, other processes' local copies within
+# CHAT_USER_LOCAL_TTL.
+
+class CachedUser:
+    """
+    Lightweight stand-in for User on WebSocket scopes.
+    Use `user.id` (not the object) when writing FKs.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    __slots__ = ("id", "email", "username", "is_banned", "token_version")
+
+    def __init__(self, id, email, username, is_banned, token_version):
+        self.id = id
+        self.email = email
+        self.username = username
+        self.is_banned = is_banned
+        self.token_version = token_version
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.email
+
+
+_users = LocalLRU(
+    maxsize=settings.CHAT_USER_CACHE_SIZE,
+    ttl=settings.CHAT_USER_LOCAL_TTL,
+)
+
+
+def user_key(user_id):
+    return f"chat:wsuser:{user_id}"
+
+
+async def aget_ws_user(user_id, token_version=None):
+    """
+    Returns a CachedUser, or None if the user doesn't exist, is inactive
+    or banned, or the token's token_version is stale.
+    """
+    key = user_key(user_id)
+    user = _users.get(key)
+
+    if user is None:
+        # Shared copy holds the plain row
+        row = await cache.aget(key)
+        if row is None:
+            row = await (
+                get_user_model().objects.filter(id=user_id, is_active=True)
+                .values("id", "email", "username", "is_banned", "token_version")
+                .afirst()
+            )
+            if not row:
+                return None
+            await cache.aset(key, row, settings.CHAT_USER_CACHE_TTL)
+
+        user = CachedUser(**row)
+        _users.set(key, user)
+
+    if user.is_banned:
+        return None
+
+    if token_version is not None and token_version != user.token_version:
+        return None
+
+    return user
+
+
+def invalidate_user(user_id):
+    key = user_key(user_id)
+    _users.delete(key)
+    cache.delete(key)
@@ -0,0 +1,12 @@
+from celery.schedules import crontab
+
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-unread-counters-hourly": {
+        "task": "chat.tasks.reconcile_unread",
+        "schedule": crontab(minute=17),
+    },
+    "maintain-message-partitions-daily": {
+        "task": "chat.tasks.maintain_message_partitions",
+        "schedule": crontab(hour=3, minute=41),
+    },
+}
@@ -0,0 +1,149 @@
+"""
+Conditional GET for polled chat endpoints.
+
+Validators come from one aggregate query, so an unchanged poll is
+answered with 304 before any page is loaded or serialized.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import MESSAGE_RETENTION, Conversation, ConversationMember, Message
+
+# Bump when the response format changes so old ETags stop matching
+VALIDATOR_VERSION = 1
+
+
+def make_etag(*parts):
+    raw = "|".join(str(p) for p in (VALIDATOR_VERSION, *parts))
+    return 'W/"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:32]
+
+
+def write_grace():
+    # Write-behind stamps rows at submit time, up to a flush interval
+    # before they hit the DB (and before expires_at is stamped).
+    return timedelta(seconds=1 + settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL)
+
+
+def expiry_cutoff():
+    """
+    Rows created after this are not expired yet. expires_at is stamped
+    at save (created_at + retention, plus at most the write grace), so
+    the oldest created_at above the cutoff moves exactly when something
+    visible expires — no write needed to change the ETag.
+    """
+    return timezone.now() - MESSAGE_RETENTION - write_grace()
+
+
+def chat_list_validators(user_id):
+    """
+    Chat list changes when a conversation gets a message
+    (last_message_at) or its last message expires, is edited or has a
+    message edited / deleted (conversation updated_at), when any member
+    row of the user's conversations changes (unread count, read cursor,
+    joined/left) or when a member renames (user updated_at).
+    """
+    conversation_ids = ConversationMember.objects.filter(
+        user_id=user_id,
+        conversation__is_active=True,
+    ).values("conversation_id")
+
+    state = ConversationMember.objects.filter(
+        conversation_id__in=conversation_ids,
+    ).aggregate(
+        count=Count("id"),
+        last_message_at=Max("conversation__last_message_at"),
+        oldest_visible_at=Min(
+            "conversation__last_message_at",
+            filter=Q(conversation__last_message_at__gt=expiry_cutoff()),
+        ),
+        conversation_updated_at=Max("conversation__updated_at"),
+        member_updated_at=Max("updated_at"),
+        user_updated_at=Max("user__updated_at"),
+    )
+
+    timestamps = (
+        state["last_message_at"],
+        state["conversation_updated_at"],
+        state["member_updated_at"],
+        state["user_updated_at"],
+    )
+    last_modified = max((t for t in timestamps if t), default=None)
+    etag = make_etag(
+        "list", user_id, state["count"], state["oldest_visible_at"], *timestamps,
+    )
+    return etag, last_modified
+
+
+def history_validators(conversation_id, user_id):
+    """
+    History changes when the conversation gets a message, a message
+    is edited / deleted (updated_at) or its oldest message expires.
+    user_id is in the tag because is_mine differs per viewer.
+    """
+    oldest_visible = (
+        Message.objects.filter(
+            conversation_id=OuterRef("pk"),
+            created_at__gt=expiry_cutoff(),
+        )
+        .order_by("created_at")
+        .values("created_at")[:1]
+    )
+    last_message_at, updated_at, oldest_visible_at = (
+        Conversation.objects.filter(id=conversation_id)
+        .annotate(oldest_visible_at=Subquery(oldest_visible))
+        .values_list("last_message_at", "updated_at", "oldest_visible_at")
+        .first()
+    ) or (None, None, None)
+    last_modified = max((t for t in (last_message_at, updated_at) if t), default=None)
+    etag = make_etag(
+        "history", conversation_id, user_id,
+        last_message_at, updated_at, oldest_visible_at,
+    )
+    return etag, last_modified
+
+
+class ConditionalGetMixin:
+    """
+    For DRF views: get_validators(request, **kwargs) → (etag, last_modified).
+    Runs after authentication/permissions (inside dispatch). Without
+    validators (etag None, the default) the GET is served as usual.
+    """
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, **kwargs)
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+
+        # Last-Modified has 1s resolution: only use it once no further
+        # write can land in that second.
+        timestamp = None
+        if last_modified and last_modified < timezone.now() - write_grace():
+            timestamp = int(last_modified.timestamp())
+
+        not_modified = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=timestamp,
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+
+        if response.status_code == 200:
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+            # Clients keep the copy but always revalidate
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+    def get_validators(self, request, **kwargs):
+        return None, None
@@ -1,31 +1,216 @@
+import asyncio
 import json
-import re
 from uuid import UUID
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.utils import timezone
+from django.conf import settings
 
+from .cache import aget_membership
 from .models import (
     Conversation,
-    ConversationMember,
     Message,
     MessageReceipt,
 )
+from .persistence import write_behind
+from .services import advance_read_cursor
+from .events import (
+    conversation_group_name,
+    message_new_group_event,
+    message_read_group_event,
+    user_group_name,
+)
+from .typing import typing_coalescer
+
+
+def can_join(membership) -> bool:
+    """
+    ✅ MEMBERSHIP RULES
+    GLOBAL → implicit membership
+    NON-GLOBAL → must exist in ConversationMember (and not be banned)
+    """
+    if not membership["exists"]:
+        return False
+
+    if membership["type"] == Conversation.Type.GLOBAL:
+        return True
 
+    return membership["is_member"] and not membership["is_banned"]
 
-def safe_group_name(conversation_id: str) -> str:
+
+class BaseChatConsumer(AsyncWebsocketConsumer):
     """
-    Sanitize conversation_id to a valid Channels group name.
+    Chat events shared by the per-conversation and multiplexed sockets.
+    Subclasses decide which conversation an incoming frame targets.
     """
-    return re.sub(r'[^a-zA-Z0-9_\-\.]', '_', conversation_id)[:100]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Typing state machine per conversation (this user):
+        # conversation_id → expiry handle, present while typing
+        self.typing_expiry = {}
+
+    # -------------------- CHAT EVENTS --------------------
+
+    async def handle_chat_event(self, conversation_id, event_type, payload):
+        user = self.scope["user"]
+        group_name = conversation_group_name(conversation_id)
+
+        # -------- MESSAGE SEND --------
+        if event_type == "message.send":
+            content = payload.get("content")
+            message_type = payload.get("message_type", "TEXT")
+
+            if not content or message_type not in Message.Type.values:
+                return
+
+            message = Message(
+                conversation_id=conversation_id,
+                sender_id=user.id,
+                type=message_type,
+                content={"text": content},
+            )
+
+            if settings.CHAT_WRITE_BEHIND:
+                # ✅ Broadcast now, bulk-insert on the next flush tick
+                await write_behind.submit(message)
+            else:
+                # ✅ Persist message (WhatsApp-style)
+                # ❗ last_message_at is handled in Message.save()
+                await message.asave()
+
+            await self.channel_layer.group_send(
+                group_name,
+                message_new_group_event(conversation_id, {
+                    "id": str(message.id),
+                    "sender": user.username,
+                    "type": message.type,
+                    "content": message.content,
+                    "created_at": message.created_at.isoformat(),
+                }),
+            )
+
+        # -------- TYPING --------
+        elif event_type in ("typing.start", "typing.stop"):
+            self.set_typing(conversation_id, event_type == "typing.start")
+
+        # -------- READ CURSOR ("read up to X") --------
+        elif event_type == "message.read" and payload.get("up_to"):
+            message = await database_sync_to_async(advance_read_cursor)(
+                conversation_id,
+                user.id,
+                payload["up_to"],
+            )
+
+            # Cursor didn't move → nothing new to tell the room
+            if not message:
+                return
+
+            await self.channel_layer.group_send(
+                group_name,
+                message_read_group_event(
+                    conversation_id, str(message.id), user.username, up_to=True
+                ),
+            )
+
+        # -------- READ RECEIPT (legacy, per message) --------
+        elif event_type == "message.read":
+            message_id = payload.get("message_id")
+            if not message_id:
+                return
+
+            # ✅ Correct WhatsApp-style read receipt
+            await MessageReceipt.objects.aupdate_or_create(
+                message_id=message_id,
+                user_id=user.id,
+                defaults={"status": MessageReceipt.Status.READ},
+            )
+
+            await self.channel_layer.group_send(
+                group_name,
+                message_read_group_event(conversation_id, message_id, user.username),
+            )
+
+    async def close_chat(self):
+        # Closing the socket ends any "typing…" state
+        for conversation_id in list(self.typing_expiry):
+            self.set_typing(conversation_id, False)
+
+        # Don't leave this socket's messages sitting in the buffer
+        if settings.CHAT_WRITE_BEHIND and write_behind.pending:
+            await write_behind.flush()
+
+    # -------------------- TYPING STATE --------------------
+
+    def set_typing(self, conversation_id, is_typing):
+        """
+        Redundant start/stop is suppressed here; repeated starts only
+        push the expiry back. Real transitions go to the coalescer,
+        which emits at most one frame per conversation per window.
+        """
+        was_typing = conversation_id in self.typing_expiry
+
+        if was_typing:
+            self.typing_expiry.pop(conversation_id).cancel()
+
+        if is_typing:
+            # Stale "typing" expires if the client never sends stop
+            self.typing_expiry[conversation_id] = asyncio.get_running_loop().call_later(
+                settings.CHAT_TYPING_TTL,
+                self.set_typing,
+                conversation_id,
+                False,
+            )
+
+        if is_typing == was_typing:
+            return
+
+        typing_coalescer.update(
+            conversation_id,
+            self.channel_name,
+            self.scope["user"].username,
+            is_typing,
+        )
+
+    # -------------------- GROUP EVENTS --------------------
+    # Pre-encoded "frame" is forwarded as-is. The fallback encodes events
+    # sent by nodes that predate serialize-once (rolling deploys).
+
+    async def message_new(self, event):
+        await self.send(text_data=event.get("frame") or json.dumps({
+            "type": "message.new",
+            **event,
+        }))
+
+    async def typing_event(self, event):
+        await self.send(text_data=event.get("frame") or json.dumps({
+            "type": "typing",
+            "user": event["user"],
+            "is_typing": event["is_typing"],
+        }))
+
+    async def message_read(self, event):
+        await self.send(text_data=event.get("frame") or json.dumps({
+            "type": "message.read",
+            "message_id": event["message_id"],
+            "user": event["user"],
+            "up_to": event.get("up_to", False),
+        }))
+
+    async def conversation_new(self, event):
+        await self.send(text_data=event["frame"])
+
+
+class ChatConsumer(BaseChatConsumer):
+    """
+    One socket per conversation: ws/chat/<conversation_id>/
+    """
 
-class ChatConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.group_name = None
         self.conversation_id = None
-        self.conversation = None
 
     # -------------------- CONNECT --------------------
 
@@ -46,35 +231,22 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # Fetch conversation
-        conversation = await Conversation.objects.filter(
-            id=conversation_uuid
-        ).afirst()
+        # Cached lookup (LRU → Redis → DB): reconnect storms don't hit the DB
+        membership = await aget_membership(conversation_uuid, user.id)
 
-        if not conversation:
+        if not membership["exists"]:
             print("Conversation not found:", conversation_id)
             await self.close()
             return
 
-        # ✅ MEMBERSHIP RULES
-        # GLOBAL → implicit membership
-        # NON-GLOBAL → must exist in ConversationMember
-        if conversation.type != Conversation.Type.GLOBAL:
-            is_member = await ConversationMember.objects.filter(
-                conversation=conversation,
-                user=user,
-                is_banned=False,
-            ).aexists()
-
-            if not is_member:
-                print(f"User {user.email} is not a member of {conversation_id}")
-                await self.close()
-                return
+        if not can_join(membership):
+            print(f"User {user.email} is not a member of {conversation_id}")
+            await self.close()
+            return
 
         # Passed all checks
         self.conversation_id = conversation_uuid
-        self.conversation = conversation
-        self.group_name = f"chat_{safe_group_name(conversation_id)}"
+        self.group_name = conversation_group_name(conversation_uuid)
 
         await self.channel_layer.group_add(
             self.group_name,
@@ -87,6 +259,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
     # -------------------- DISCONNECT --------------------
 
     async def disconnect(self, close_code):
+        await self.close_chat()
+
         if self.group_name:
             await self.channel_layer.group_discard(
                 self.group_name,
@@ -101,98 +275,161 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except json.JSONDecodeError:
             return
 
-        event_type = data.get("type")
-        payload = data.get("payload", {})
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated or not self.conversation_id:
+            return
+
+        if not isinstance(data, dict) or not isinstance(data.get("payload", {}), dict):
+            return
+
+        await self.handle_chat_event(
+            self.conversation_id,
+            data.get("type"),
+            data.get("payload", {}),
+        )
+
+
+class MultiplexChatConsumer(BaseChatConsumer):
+    """
+    One socket per user for all conversations: ws/chat/
+
+    Client frames:
+        {"type": "subscribe",   "payload": {"conversation_id": ...}}
+        {"type": "unsubscribe", "payload": {"conversation_id": ...}}
+        {"type": "message.send" | "typing.start" | ..., "payload": {"conversation_id": ..., ...}}
+
+    Outbound chat frames are the same as ChatConsumer's and carry
+    conversation_id. The socket also joins the user's own group
+    (conversation.new notifications).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_group = None
+        self.subscriptions = set()
+
+    # -------------------- CONNECT --------------------
+
+    async def connect(self):
         user = self.scope.get("user")
 
         if not user or not user.is_authenticated:
+            await self.close()
             return
 
-        # -------- MESSAGE SEND --------
-        if event_type == "message.send":
-            content = payload.get("content")
-            message_type = payload.get("message_type", "TEXT")
+        self.user_group = user_group_name(user.id)
 
-            if not content:
-                return
+        await self.channel_layer.group_add(
+            self.user_group,
+            self.channel_name,
+        )
 
-            # ✅ Persist message (WhatsApp-style)
-            message = await Message.objects.acreate(
-                conversation=self.conversation,
-                sender=user,
-                type=message_type,
-                content={"text": content},
-                created_at=timezone.now(),
-            )
+        await self.accept()
+        print(f"WS CONNECT (multiplex): user={user.email}")
 
-            # ❗ last_message_at is now handled in Message.save()
-            # ❗ No duplicate update here
+    # -------------------- DISCONNECT --------------------
 
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "message_new",
-                    "message": {
-                        "id": str(message.id),
-                        "sender": user.username,
-                        "type": message.type,
-                        "content": message.content,
-                        "created_at": message.created_at.isoformat(),
-                    },
-                },
+    async def disconnect(self, close_code):
+        await self.close_chat()
+
+        for conversation_id in self.subscriptions:
+            await self.channel_layer.group_discard(
+                conversation_group_name(conversation_id),
+                self.channel_name,
             )
+        self.subscriptions.clear()
 
-        # -------- TYPING --------
-        elif event_type in ("typing.start", "typing.stop"):
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "typing_event",
-                    "user": user.username,
-                    "is_typing": event_type == "typing.start",
-                },
+        if self.user_group:
+            await self.channel_layer.group_discard(
+                self.user_group,
+                self.channel_name,
             )
 
-        # -------- READ RECEIPT --------
-        elif event_type == "message.read":
-            message_id = payload.get("message_id")
-            if not message_id:
+    # -------------------- RECEIVE --------------------
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            return
+
+        # A malformed frame must not kill the socket (and every
+        # conversation multiplexed on it)
+        if not isinstance(data, dict):
+            await self.send_error(None, "Frame must be a JSON object")
+            return
+
+        event_type = data.get("type")
+        payload = data.get("payload", {})
+
+        if not isinstance(payload, dict):
+            await self.send_error(event_type, "payload must be a JSON object")
+            return
+
+        try:
+            conversation_id = UUID(str(payload.get("conversation_id")))
+        except ValueError:
+            await self.send_error(event_type, "Invalid conversation_id")
+            return
+
+        if event_type == "subscribe":
+            await self.subscribe(conversation_id)
+
+        elif event_type == "unsubscribe":
+            await self.unsubscribe(conversation_id)
+
+        elif conversation_id in self.subscriptions:
+            await self.handle_chat_event(conversation_id, event_type, payload)
+
+        else:
+            await self.send_error(event_type, "Not subscribed", conversation_id)
+
+    # -------------------- SUBSCRIPTIONS --------------------
+
+    async def subscribe(self, conversation_id):
+        if conversation_id not in self.subscriptions:
+            if len(self.subscriptions) >= settings.CHAT_MULTIPLEX_MAX_SUBSCRIPTIONS:
+                await self.send_error("subscribe", "Too many subscriptions", conversation_id)
                 return
 
-            # ✅ Correct WhatsApp-style read receipt
-            await MessageReceipt.objects.aupdate_or_create(
-                message_id=message_id,
-                user=user,
-                defaults={"status": MessageReceipt.Status.READ},
-            )
+            membership = await aget_membership(conversation_id, self.scope["user"].id)
+            if not can_join(membership):
+                await self.send_error("subscribe", "Not a member", conversation_id)
+                return
 
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "message_read",
-                    "message_id": message_id,
-                    "user": user.username,
-                },
+            self.subscriptions.add(conversation_id)
+            await self.channel_layer.group_add(
+                conversation_group_name(conversation_id),
+                self.channel_name,
             )
 
-    # -------------------- GROUP EVENTS --------------------
-
-    async def message_new(self, event):
         await self.send(text_data=json.dumps({
-            "type": "message.new",
-            **event,
+            "type": "subscribed",
+            "conversation_id": str(conversation_id),
         }))
 
-    async def typing_event(self, event):
+    async def unsubscribe(self, conversation_id):
+        if conversation_id in self.subscriptions:
+            self.set_typing(conversation_id, False)
+            self.subscriptions.discard(conversation_id)
+            await self.channel_layer.group_discard(
+                conversation_group_name(conversation_id),
+                self.channel_name,
+            )
+
         await self.send(text_data=json.dumps({
-            "type": "typing",
-            "user": event["user"],
-            "is_typing": event["is_typing"],
+            "type": "unsubscribed",
+            "conversation_id": str(conversation_id),
         }))
 
-    async def message_read(self, event):
+    async def send_error(self, event_type, detail, conversation_id=None):
         await self.send(text_data=json.dumps({
-            "type": "message.read",
-            "message_id": event["message_id"],
-            "user": event["user"],
+            "type": "error",
+            "event": event_type,
+            "conversation_id": str(conversation_id) if conversation_id else None,
+            "detail": detail,
         }))
@@ -0,0 +1,88 @@
+import json
+import re
+
+
+def safe_group_name(conversation_id: str) -> str:
+    """
+    Sanitize conversation_id to a valid Channels group name.
+    """
+    return re.sub(r'[^a-zA-Z0-9_\-\.]', '_', conversation_id)[:100]
+
+
+def conversation_group_name(conversation_id) -> str:
+    return f"chat_{safe_group_name(str(conversation_id))}"
+
+
+def user_group_name(user_id) -> str:
+    """
+    Per-user group: every multiplexed socket of this user joins it.
+    """
+    return f"chat_user_{user_id}"
+
+
+# -------------------- GROUP EVENT BUILDERS --------------------
+# The outbound WS frame is JSON-encoded ONCE here, on the sender side,
+# and carried through the channel layer as "frame". Every recipient's
+# handler forwards it verbatim instead of re-encoding per socket.
+# Frames carry conversation_id so multiplexed sockets can route them.
+
+def message_new_group_event(conversation_id, message_data: dict) -> dict:
+    return {
+        "type": "message_new",
+        "frame": json.dumps({
+            "type": "message_new",
+            "conversation_id": str(conversation_id),
+            "message": message_data,
+        }),
+    }
+
+
+def typing_group_event(conversation_id, changes: dict) -> dict:
+    """
+    One aggregated frame for all typing changes in a window.
+    `changes` maps username -> is_typing.
+    """
+    users = [
+        {"user": username, "is_typing": is_typing}
+        for username, is_typing in changes.items()
+    ]
+    frame = {
+        "type": "typing",
+        "conversation_id": str(conversation_id),
+        "users": users,
+    }
+
+    # Old clients only read the single user/is_typing pair
+    if len(users) == 1:
+        frame.update(users[0])
+
+    return {
+        "type": "typing_event",
+        "frame": json.dumps(frame),
+    }
+
+
+def message_read_group_event(conversation_id, message_id: str, username: str, up_to: bool = False) -> dict:
+    return {
+        "type": "message_read",
+        "frame": json.dumps({
+            "type": "message.read",
+            "conversation_id": str(conversation_id),
+            "message_id": message_id,
+            "user": username,
+            "up_to": up_to,
+        }),
+    }
+
+
+def conversation_new_group_event(conversation_id) -> dict:
+    """
+    Sent to user groups: a multiplexed client should subscribe to it.
+    """
+    return {
+        "type": "conversation_new",
+        "frame": json.dumps({
+            "type": "conversation.new",
+            "conversation_id": str(conversation_id),
+        }),
+    }
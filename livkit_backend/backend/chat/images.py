@@ -0,0 +1,258 @@
+"""
+Image messages.
+
+Upload:   HashingUploadHandler streams the body to a temp file and
+          hashes it chunk by chunk (nothing is buffered in memory).
+Dedup:    files are content-addressed (chat/images/<sha[:2]>/<sha>.<ext>);
+          a known hash reuses the stored file and its thumbnails.
+Resize:   chat.thumbnails runs in a process pool, off the request thread.
+Deliver:  once thumbnails exist, the IMAGE message is saved and sent to
+          the conversation group like any other message.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import close_old_connections
+from PIL import Image
+
+from .events import conversation_group_name, message_new_group_event
+from .models import ChatImage, Message
+from .thumbnails import make_thumbnails
+
+logger = logging.getLogger("chat.images")
+
+ALLOWED_FORMATS = {
+    "JPEG": ("image/jpeg", ".jpg"),
+    "PNG": ("image/png", ".png"),
+    "WEBP": ("image/webp", ".webp"),
+    "GIF": ("image/gif", ".gif"),
+}
+
+
+class ImageRejected(Exception):
+    pass
+
+
+# -------------------- UPLOAD --------------------
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Every file goes to a temp file (never memory), sha256 computed on
+    the fly. Files over CHAT_IMAGE_MAX_BYTES stop the upload.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.CHAT_IMAGE_MAX_BYTES:
+            self.too_large = True
+            self.file.close()
+            raise StopUpload(connection_reset=False)
+
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.sha256.hexdigest()
+        return uploaded
+
+
+def store_image(uploaded, user):
+    """
+    Validate the upload and return its ChatImage (existing one if the
+    same bytes were uploaded before).
+    """
+    try:
+        with Image.open(uploaded.temporary_file_path()) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ImageRejected("Not a valid image")
+
+    if image_format not in ALLOWED_FORMATS:
+        raise ImageRejected(f"Unsupported image format: {image_format}")
+
+    if width * height > settings.CHAT_IMAGE_MAX_PIXELS:
+        raise ImageRejected("Image dimensions too large")
+
+    image = ChatImage.objects.filter(sha256=uploaded.sha256).first()
+    if image and default_storage.exists(image.file.name):
+        # Same bytes already stored: the temp file is simply dropped
+        return image
+
+    content_type, extension = ALLOWED_FORMATS[image_format]
+    name = f"chat/images/{uploaded.sha256[:2]}/{uploaded.sha256}{extension}"
+
+    # Temp file is moved into place, not copied
+    if not default_storage.exists(name):
+        name = default_storage.save(name, uploaded)
+
+    if image:
+        # Row survived but its file didn't: store again, redo thumbnails
+        image.file = name
+        image.status = ChatImage.Status.PENDING
+        image.save(update_fields=["file", "status"])
+        return image
+
+    image, _ = ChatImage.objects.get_or_create(
+        sha256=uploaded.sha256,
+        defaults={
+            "file": name,
+            "content_type": content_type,
+            "size": uploaded.size,
+            "uploaded_by": user,
+        },
+    )
+    return image
+
+
+# -------------------- THUMBNAILS --------------------
+
+_process_pool = None
+_finalizers = None
+
+
+def get_pools():
+    global _process_pool, _finalizers
+
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.CHAT_IMAGE_WORKERS,
+            # spawn: forking a threaded ASGI/WSGI server is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # Wait on the workers and write results (DB + broadcast)
+        _finalizers = ThreadPoolExecutor(
+            max_workers=settings.CHAT_IMAGE_WORKERS,
+            thread_name_prefix="chat-images",
+        )
+    return _process_pool, _finalizers
+
+
+def submit_image_message(image, conversation_id, user, caption=""):
+    """
+    READY image (or 0 workers) → message sent now. Otherwise thumbnails
+    are queued and the message follows when they are done.
+    Returns the sent message payload, or None if queued (or failed).
+    """
+    if image.status == ChatImage.Status.READY:
+        return send_image_message(image, conversation_id, user.id, user.username, caption)
+
+    args = (image.id, conversation_id, user.id, user.username, caption)
+
+    # 0 workers: inline (tests / local debugging)
+    if not settings.CHAT_IMAGE_WORKERS:
+        return finish_image_message(None, *args)
+
+    process_pool, finalizers = get_pools()
+    future = process_pool.submit(
+        make_thumbnails,
+        default_storage.path(image.file.name),
+        settings.CHAT_IMAGE_THUMBNAIL_SIZES,
+    )
+    finalizers.submit(finish_image_message, future, *args)
+    return None
+
+
+def finish_image_message(future, image_id, conversation_id, user_id, username, caption):
+    """
+    Store thumbnail results and send the message. Returns its payload,
+    or None if thumbnailing failed (image marked FAILED). `future` None:
+    inline, on the request thread (its connection is left alone).
+    """
+    in_worker = future is not None
+    if in_worker:
+        close_old_connections()
+    try:
+        image = ChatImage.objects.get(id=image_id)
+
+        if future is None:
+            result = make_thumbnails(
+                default_storage.path(image.file.name),
+                settings.CHAT_IMAGE_THUMBNAIL_SIZES,
+            )
+        else:
+            result = future.result()
+
+        width, height, paths = result
+        image.width = width
+        image.height = height
+        image.thumbnails = {
+            size: os.path.relpath(path, settings.MEDIA_ROOT)
+            for size, path in paths.items()
+        }
+        image.status = ChatImage.Status.READY
+        image.save(update_fields=["width", "height", "thumbnails", "status"])
+
+        return send_image_message(image, conversation_id, user_id, username, caption)
+
+    except Exception:
+        logger.exception("Image %s: thumbnailing failed", image_id)
+        ChatImage.objects.filter(id=image_id).update(status=ChatImage.Status.FAILED)
+        return None
+
+    finally:
+        if in_worker:
+            close_old_connections()
+
+
+# -------------------- MESSAGE --------------------
+
+def image_content(image, caption=""):
+    content = {
+        "image": {
+            "id": image.id,
+            "url": image.file.url,
+            "width": image.width,
+            "height": image.height,
+            "content_type": image.content_type,
+            "thumbnails": {
+                size: default_storage.url(name)
+                for size, name in image.thumbnails.items()
+            },
+        },
+    }
+    # Caption doubles as text: chat list preview + full-text search
+    if caption:
+        content["text"] = caption
+    return content
+
+
+def send_image_message(image, conversation_id, user_id, username, caption=""):
+    message = Message.objects.create(
+        conversation_id=conversation_id,
+        sender_id=user_id,
+        type=Message.Type.IMAGE,
+        content=image_content(image, caption),
+    )
+
+    payload = {
+        "id": str(message.id),
+        "sender": username,
+        "type": message.type,
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+    }
+
+    async_to_sync(get_channel_layer().group_send)(
+        conversation_group_name(conversation_id),
+        message_new_group_event(conversation_id, payload),
+    )
+    return payload
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from chat.services import rebuild_friendships
+
+
+class Command(BaseCommand):
+    help = "Build Friendship edges from accepted friend requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Also delete edges that no accepted request backs",
+        )
+
+    def handle(self, *args, **options):
+        created, pruned = rebuild_friendships(
+            batch_size=options["batch_size"],
+            prune=options["prune"],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Created {created} friendship edges, pruned {pruned}")
+        )
@@ -0,0 +1,71 @@
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.events import message_new_group_event
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-recipient CPU of chat fan-out (encode per socket vs serialize-once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--members",
+            type=int,
+            nargs="+",
+            default=[1000, 10000],
+        )
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def handle(self, *args, **options):
+        conversation_id = uuid.uuid4()
+        message_data = {
+            "id": str(uuid.uuid4()),
+            "sender": "benchmark_user",
+            "type": "TEXT",
+            "content": {"text": "hello everyone, this is a typical chat line 👋"},
+            "created_at": timezone.now().isoformat(),
+        }
+
+        # What group_send carried before / after
+        legacy_event = {"type": "message_new", "message": message_data}
+
+        for members in options["members"]:
+            before = self._run(options["rounds"], members, lambda: legacy_event)
+            after = self._run(
+                options["rounds"],
+                members,
+                lambda: message_new_group_event(conversation_id, message_data),
+                per_recipient=lambda event: event.get("frame"),
+            )
+
+            self.stdout.write(
+                f"{members:>6} members | "
+                f"before {before * 1e6:8.3f} µs/recipient | "
+                f"after {after * 1e6:8.3f} µs/recipient | "
+                f"x{before / after if after else float('inf'):.1f}"
+            )
+
+    @staticmethod
+    def _run(rounds, members, build, per_recipient=None):
+        """
+        Best-of-N CPU seconds per recipient for one broadcast.
+        `build` runs once (sender side), `per_recipient` once per socket.
+        """
+        if per_recipient is None:
+            # Old handler: every recipient re-encodes the same event
+            def per_recipient(event):
+                return json.dumps({"type": "message.new", **event})
+
+        best = None
+        for _ in range(rounds):
+            started = time.process_time()
+            event = build()
+            for _ in range(members):
+                per_recipient(event)
+            elapsed = (time.process_time() - started) / members
+            best = elapsed if best is None else min(best, elapsed)
+        return best
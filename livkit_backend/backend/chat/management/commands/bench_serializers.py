@@ -0,0 +1,89 @@
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from chat.models import Message
+from chat.serializers import MessageSerializer, message_row, message_to_dict
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Benchmark message serialization: ModelSerializer vs values_list fast path (rows/s)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[100, 500],
+        )
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def handle(self, *args, **options):
+        users = [User(id=i, username=f"user{i}") for i in range(1, 6)]
+        request = SimpleNamespace(user=SimpleNamespace(id=1, is_authenticated=True))
+        renderer = JSONRenderer()
+
+        for count in options["rows"]:
+            messages = self._messages(count, users)
+            rows = [message_row(m) for m in messages]
+
+            slow_json = renderer.render(
+                MessageSerializer(messages, many=True, context={"request": request}).data
+            )
+            fast_json = renderer.render([message_to_dict(r, request.user.id) for r in rows])
+            if slow_json != fast_json:
+                raise CommandError("Fast path output differs from MessageSerializer")
+
+            slow = self._run(options["rounds"], lambda: MessageSerializer(
+                messages, many=True, context={"request": request}
+            ).data)
+            fast = self._run(options["rounds"], lambda: [
+                message_to_dict(r, request.user.id) for r in rows
+            ])
+
+            self.stdout.write(
+                f"{count:>5} rows | "
+                f"serializer {count / slow:>10,.0f} rows/s | "
+                f"fast {count / fast:>10,.0f} rows/s | "
+                f"x{slow / fast:.1f} | output identical"
+            )
+
+    @staticmethod
+    def _messages(count, users):
+        conversation_id = uuid.uuid4()
+        now = timezone.now()
+        messages = []
+        for i in range(count):
+            sender = users[i % len(users)] if i % 17 else None
+            messages.append(Message(
+                id=uuid.uuid4(),
+                conversation_id=conversation_id,
+                sender=sender,
+                type=Message.Type.TEXT,
+                content={"text": f"message number {i} 👋"},
+                created_at=now,
+                edited_at=now if i % 5 == 0 else None,
+                is_deleted=False,
+                expires_at=now,
+            ))
+        return messages
+
+    @staticmethod
+    def _run(rounds, serialize):
+        """
+        Best-of-N CPU seconds for one page.
+        """
+        best = None
+        for _ in range(rounds):
+            started = time.process_time()
+            serialize()
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -1,17 +1,239 @@
-from django.core.management.base import BaseCommand
+import json
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from datetime import timedelta
-from chat.models import Message
+from django.utils.dateparse import parse_datetime
+
+from chat.models import ConversationMember, Message, MessageReceipt, MESSAGE_RETENTION
+
+DEFAULT_CHECKPOINT = os.path.join(tempfile.gettempdir(), "livkit_cleanup_old_messages.json")
+
 
 class Command(BaseCommand):
-    help = "Delete chat messages older than 3 months"
+    help = (
+        "Delete expired chat messages (expires_at passed) in small batches. "
+        "Throttled, resumable, receipts removed explicitly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.2,
+            help="Seconds to pause between batches (gives the DB room to breathe)",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after N batches (resume later with --resume)",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=DEFAULT_CHECKPOINT,
+            help="Checkpoint file (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue from the checkpoint (same cutoff, same position)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only estimate rows, batches and time",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        state = self.load_checkpoint(options) if options["resume"] else None
+        if state is None:
+            state = {
+                "cutoff": timezone.now().isoformat(),
+                "last_expires_at": None,
+                "last_id": None,
+                "messages": 0,
+                "receipts": 0,
+            }
+
+        cutoff = parse_datetime(state["cutoff"])
 
-    def handle(self, *args, **kwargs):
-        cutoff_date = timezone.now() - timedelta(days=90)
-        deleted, _ = Message.objects.filter(
-            created_at__lt=cutoff_date
-        ).delete()
+        if options["dry_run"]:
+            self.estimate(cutoff, batch_size, options["sleep"])
+            return
+
+        # Old rows saved before expires_at existed: stamped batch by batch
+        # too (counts against --max-batches), so they can expire below
+        batches = self.stamp_legacy(batch_size, options["sleep"], options["max_batches"])
+        if batches:
+            self.save_checkpoint(options["checkpoint"], state)
+
+        started = time.monotonic()
+        deleted_here = 0
+
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            rows = list(self.next_batch(cutoff, state, batch_size))
+            if not rows:
+                break
+
+            ids = [pk for pk, _ in rows]
+            messages, receipts = self.purge(ids)
+
+            last_id, last_expires_at = rows[-1]
+            state["last_id"] = str(last_id)
+            state["last_expires_at"] = last_expires_at.isoformat()
+            state["messages"] += messages
+            state["receipts"] += receipts
+            self.save_checkpoint(options["checkpoint"], state)
+
+            batches += 1
+            deleted_here += messages
+            elapsed = time.monotonic() - started
+            rate = deleted_here / elapsed if elapsed else 0
+
+            self.stdout.write(
+                f"Batch {batches}: -{messages} messages, -{receipts} receipts "
+                f"(total {state['messages']} messages, {rate:,.0f} rows/s)"
+            )
+
+            if len(rows) < batch_size:
+                break
+
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        finished = (
+            not self.legacy().exists()
+            and not self.next_batch(cutoff, state, 1).exists()
+        )
+        if finished:
+            self.clear_checkpoint(options["checkpoint"])
 
         self.stdout.write(
-            self.style.SUCCESS(f"Deleted {deleted} old messages")
+            self.style.SUCCESS(
+                f"Deleted {state['messages']} old messages, {state['receipts']} receipts"
+                + ("" if finished else " (more left, run again with --resume)")
+            )
         )
+
+    # -------------------- BATCHES --------------------
+
+    def legacy(self):
+        return Message.objects.filter(expires_at__isnull=True)
+
+    def stamp_legacy(self, batch_size, sleep, max_batches):
+        """
+        expires_at = created_at + retention on legacy rows, one small
+        UPDATE per batch. Stamped rows leave the NULL set, so no cursor
+        is needed. Returns the number of batches run.
+        """
+        batches = 0
+        stamped = 0
+
+        while max_batches is None or batches < max_batches:
+            ids = list(self.legacy().values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+
+            stamped += Message.objects.filter(
+                id__in=ids, expires_at__isnull=True
+            ).update(expires_at=F("created_at") + MESSAGE_RETENTION)
+            batches += 1
+
+            if len(ids) < batch_size:
+                break
+
+            if sleep:
+                time.sleep(sleep)
+
+        if stamped:
+            self.stdout.write(f"Stamped expires_at on {stamped} legacy messages")
+        return batches
+
+    def expired(self, cutoff):
+        return Message.objects.filter(expires_at__lte=cutoff)
+
+    def next_batch(self, cutoff, state, size):
+        """
+        Keyset walk over (expires_at, id): each batch is an index range
+        scan, and rows that fail to delete can't stall the loop.
+        """
+        query = self.expired(cutoff)
+
+        if state["last_id"]:
+            last_expires_at = parse_datetime(state["last_expires_at"])
+            query = query.filter(
+                Q(expires_at__gt=last_expires_at)
+                | Q(expires_at=last_expires_at, id__gt=state["last_id"])
+            )
+
+        return query.order_by("expires_at", "id").values_list("id", "expires_at")[:size]
+
+    def purge(self, ids):
+        """
+        Dependents first, each as one statement; the Message delete then
+        finds nothing left to cascade.
+        """
+        with transaction.atomic():
+            receipts, _ = MessageReceipt.objects.filter(message_id__in=ids).delete()
+
+            ConversationMember.objects.filter(
+                last_read_message_id__in=ids
+            ).update(last_read_message=None, updated_at=timezone.now())
+
+            _, deleted = Message.objects.filter(id__in=ids).delete()
+
+        return deleted.get(Message._meta.label, 0), receipts
+
+    def estimate(self, cutoff, batch_size, sleep):
+        messages = self.expired(cutoff).count()
+        receipts = MessageReceipt.objects.filter(message__expires_at__lte=cutoff).count()
+        legacy = self.legacy().count()
+        batches = -(-messages // batch_size)
+
+        self.stdout.write(f"Cutoff: {cutoff.isoformat()}")
+        self.stdout.write(f"Messages to delete: {messages}")
+        if legacy:
+            self.stdout.write(f"Messages without expires_at (stamped first): {legacy}")
+        self.stdout.write(f"Receipts to delete: {receipts}")
+        self.stdout.write(
+            f"Batches: {batches} x {batch_size}, at least {batches * sleep:.0f}s of sleep"
+        )
+
+    # -------------------- CHECKPOINT --------------------
+
+    def load_checkpoint(self, options):
+        try:
+            with open(options["checkpoint"]) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            self.stdout.write("No checkpoint found, starting fresh")
+            return None
+        except ValueError:
+            raise CommandError(f"Corrupt checkpoint: {options['checkpoint']}")
+
+        self.stdout.write(
+            f"Resuming: cutoff {state['cutoff']}, {state['messages']} messages already deleted"
+        )
+        return state
+
+    def save_checkpoint(self, path, state):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def clear_checkpoint(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Postgres only: maintain monthly partitions of chat messages. "
+        "Pre-creates upcoming months and drops months past retention."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="One-time: rebuild chat_message as a partitioned table (copies all rows)",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=None,
+            help="Months of partitions to keep pre-created (default: CHAT_PARTITION_MONTHS_AHEAD)",
+        )
+        parser.add_argument(
+            "--no-drop",
+            action="store_true",
+            help="Only create partitions, never drop",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Show what would be created / dropped",
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported():
+            raise CommandError("Message partitioning requires PostgreSQL")
+
+        months_ahead = options["months_ahead"]
+        dry_run = options["dry_run"]
+
+        if options["convert"]:
+            if dry_run:
+                raise CommandError("--convert can't be combined with --dry-run")
+
+            try:
+                converted = partitions.convert(months_ahead)
+            except partitions.PartitionError as e:
+                raise CommandError(str(e))
+
+            for table in converted:
+                self.stdout.write(self.style.SUCCESS(f"Converted {table} to monthly partitions"))
+
+        prefix = "Would " if dry_run else ""
+
+        for name in partitions.ensure_partitions(months_ahead, dry_run=dry_run):
+            self.stdout.write(f"{prefix}create {name}")
+
+        if not options["no_drop"]:
+            for name in partitions.drop_expired_partitions(dry_run=dry_run):
+                self.stdout.write(f"{prefix}drop {name}")
+
+        self.stdout.write(self.style.SUCCESS("Partition maintenance done"))
@@ -1,21 +1,12 @@
 from urllib.parse import parse_qs
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.conf import settings
-from asgiref.sync import sync_to_async
 import jwt
 import logging
 
-User = get_user_model()
-logger = logging.getLogger("chat.middleware")
-
+from .cache import aget_ws_user
 
-@sync_to_async
-def get_user(user_id):
-    try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
+logger = logging.getLogger("chat.middleware")
 
 
 class JWTAuthMiddleware:
@@ -39,7 +30,12 @@ class JWTAuthMiddleware:
 
                 user_id = payload.get("user_id")
                 if user_id:
-                    scope["user"] = await get_user(user_id)
+                    # ✅ TTL cache → native async ORM on miss (no thread pool)
+                    user = await aget_ws_user(
+                        user_id,
+                        payload.get("token_version"),
+                    )
+                    scope["user"] = user or AnonymousUser()
                     logger.info(
                         f"WebSocket JWT valid: user={scope['user']}"
                     )
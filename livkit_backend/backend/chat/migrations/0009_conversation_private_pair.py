@@ -0,0 +1,69 @@
+# Generated by Django 5.2.10 on 2026-10-18 15:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_private_pairs(apps, schema_editor):
+    """
+    Key every two-member PRIVATE conversation. If a pair already has
+    duplicates (the old get-or-create was racy), only the most recently
+    active one gets the key; the others stay reachable from the chat list.
+    """
+    Conversation = apps.get_model("chat", "Conversation")
+    ConversationMember = apps.get_model("chat", "ConversationMember")
+
+    members = {}
+    rows = ConversationMember.objects.filter(
+        conversation__type="PRIVATE"
+    ).values_list("conversation_id", "user_id")
+    for conversation_id, user_id in rows.iterator():
+        members.setdefault(conversation_id, set()).add(user_id)
+
+    keyed = set()
+    conversations = Conversation.objects.filter(
+        id__in=list(members)
+    ).order_by(F("last_message_at").desc(nulls_last=True), "-created_at")
+
+    for conversation in conversations.iterator():
+        users = members[conversation.id]
+        if len(users) != 2:
+            continue
+
+        pair = tuple(sorted(users))
+        if pair in keyed:
+            continue
+
+        keyed.add(pair)
+        Conversation.objects.filter(id=conversation.id).update(
+            min_user_id=pair[0],
+            max_user_id=pair[1],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_friendship'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='max_user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='min_user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_private_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('type', 'PRIVATE')), fields=('min_user', 'max_user'), name='unique_private_conversation_pair'),
+        ),
+    ]
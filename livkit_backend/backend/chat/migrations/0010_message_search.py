@@ -0,0 +1,74 @@
+from django.db import DatabaseError, migrations, transaction
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        # Generated column: Postgres keeps it current on every INSERT/UPDATE
+        schema_editor.execute(
+            "ALTER TABLE chat_message ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, coalesce(content->>'text', ''))) STORED"
+        )
+        schema_editor.execute(
+            "CREATE INDEX chat_message_search_vector_gin ON chat_message USING gin (search_vector)"
+        )
+
+    elif vendor == "sqlite":
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute(
+                    "CREATE VIRTUAL TABLE chat_message_fts USING fts5("
+                    "message_id UNINDEXED, conversation_id UNINDEXED, text, "
+                    "tokenize = 'unicode61 remove_diacritics 2')"
+                )
+        except DatabaseError as e:
+            print(f"⚠️ SQLite FTS5 unavailable, message search falls back to a scan: {e}")
+            return
+
+        schema_editor.execute(
+            "INSERT INTO chat_message_fts (message_id, conversation_id, text) "
+            "SELECT id, conversation_id, json_extract(content, '$.text') FROM chat_message"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN "
+            "INSERT INTO chat_message_fts (message_id, conversation_id, text) "
+            "VALUES (new.id, new.conversation_id, json_extract(new.content, '$.text')); "
+            "END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content ON chat_message BEGIN "
+            "DELETE FROM chat_message_fts WHERE message_id = old.id; "
+            "INSERT INTO chat_message_fts (message_id, conversation_id, text) "
+            "VALUES (new.id, new.conversation_id, json_extract(new.content, '$.text')); "
+            "END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN "
+            "DELETE FROM chat_message_fts WHERE message_id = old.id; "
+            "END"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS chat_message_search_vector_gin")
+        schema_editor.execute("ALTER TABLE chat_message DROP COLUMN IF EXISTS search_vector")
+
+    elif vendor == "sqlite":
+        for trigger in ("insert", "update", "delete"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS chat_message_fts_{trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS chat_message_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_conversation_private_pair'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
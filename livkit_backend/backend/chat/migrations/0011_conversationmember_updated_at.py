@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationmember',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -7,6 +7,9 @@ from datetime import timedelta
 
 User = settings.AUTH_USER_MODEL
 
+# 🔹 Rolling retention window for chat history
+MESSAGE_RETENTION = timedelta(days=90)
+
 
 # -------------------------
 # FRIEND REQUESTS
@@ -38,6 +41,36 @@ class FriendRequest(models.Model):
         return f"{self.sender} → {self.receiver} ({self.accepted})"
 
 
+# -------------------------
+# FRIENDSHIPS
+# -------------------------
+class Friendship(models.Model):
+    """
+    Materialized friend edge, one row per direction (A→B and B→A).
+    Written when a FriendRequest is accepted; FriendRequest stays the
+    request history. Lists, counts and "are we friends" checks read
+    only this table.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name="friendships",
+        on_delete=models.CASCADE,
+    )
+    friend = models.ForeignKey(
+        User,
+        related_name="friend_of",
+        on_delete=models.CASCADE,
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("user", "friend")
+
+    def __str__(self):
+        return f"{self.user} ↔ {self.friend}"
+
+
 # -------------------------
 # CONVERSATIONS
 # -------------------------
@@ -72,16 +105,48 @@ class Conversation(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 🔹 Bumped by any save (title…) and by message edits / soft deletes;
+    # part of the chat list / history ETags
+    updated_at = models.DateTimeField(auto_now=True)
+
     # 🔹 WhatsApp-style ordering & chat list preview support
     last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     is_active = models.BooleanField(default=True)
 
+    # 🔹 PRIVATE only: canonical pair key (lower user id, higher user id)
+    min_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    max_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
     class Meta:
         indexes = [
             models.Index(fields=["type"]),
             models.Index(fields=["last_message_at"]),
         ]
+        constraints = [
+            # One private chat per pair of users
+            models.UniqueConstraint(
+                fields=["min_user", "max_user"],
+                condition=models.Q(type="PRIVATE"),
+                name="unique_private_conversation_pair",
+            ),
+        ]
+
+    @staticmethod
+    def private_pair(user_id, other_id):
+        return min(user_id, other_id), max(user_id, other_id)
 
     def clean(self):
         """
@@ -140,9 +205,17 @@ class ConversationMember(models.Model):
         related_name="+",
     )
 
+    # 🔹 Maintained incrementally: +1 per new message from someone else,
+    # recomputed when the read cursor moves (see chat.services)
+    unread_count = models.PositiveIntegerField(default=0)
+
     is_muted = models.BooleanField(default=False)
     is_banned = models.BooleanField(default=False)
 
+    # 🔹 Any change to this member row (ETag of the chat list).
+    # queryset.update() callers set it explicitly.
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         unique_together = ("conversation", "user")
         indexes = [
@@ -200,7 +273,9 @@ class Message(models.Model):
 
     content = models.JSONField()
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default (not auto_now_add) so write-behind batches keep the
+    # timestamp that was broadcast to clients
+    created_at = models.DateTimeField(default=timezone.now)
     edited_at = models.DateTimeField(null=True, blank=True)
 
     # 🔹 Soft delete (WhatsApp-like)
@@ -219,25 +294,90 @@ class Message(models.Model):
             models.Index(fields=["conversation", "created_at"]),
         ]
 
+    def set_expiry(self):
+        """
+        Auto-set expiration (90 days).
+        Called by save() and by bulk writers, which bypass save().
+        """
+        if not self.expires_at:
+            self.expires_at = timezone.now() + MESSAGE_RETENTION
+
     def save(self, *args, **kwargs):
         is_new = self._state.adding
 
-        # 🔹 Auto-set expiration (90 days)
-        if not self.expires_at:
-            self.expires_at = timezone.now() + timedelta(days=90)
+        self.set_expiry()
 
         super().save(*args, **kwargs)
 
-        # 🔹 Update conversation ordering ONLY on new message
+        # 🔹 Update conversation ordering + unread counters ONLY on new message
         if is_new:
             Conversation.objects.filter(
                 id=self.conversation_id
             ).update(last_message_at=self.created_at)
 
+            ConversationMember.objects.filter(
+                conversation_id=self.conversation_id
+            ).exclude(
+                user_id=self.sender_id
+            ).update(
+                unread_count=models.F("unread_count") + 1,
+                updated_at=timezone.now(),
+            )
+        else:
+            # 🔹 Edit / soft delete: cached chat list + history are stale
+            Conversation.objects.filter(
+                id=self.conversation_id
+            ).update(updated_at=timezone.now())
+
     def __str__(self):
         return f"Message {self.id}"
 
 
+# -------------------------
+# CHAT IMAGES
+# -------------------------
+class ChatImage(models.Model):
+    """
+    Uploaded image, stored once per content hash (sha256).
+    Thumbnails are made in a worker process (see chat.images).
+    """
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        READY = "READY", "Ready"
+        FAILED = "FAILED", "Failed"
+
+    sha256 = models.CharField(max_length=64, unique=True)
+
+    file = models.FileField(upload_to="chat/images/")
+    content_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField()
+
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+
+    # {"96": "chat/images/ab/<sha>_96.webp", ...} (storage names)
+    thumbnails = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+
+    uploaded_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Image {self.sha256[:12]} ({self.status})"
+
+
 # -------------------------
 # MESSAGE RECEIPTS
 # -------------------------
@@ -0,0 +1,110 @@
+import base64
+from datetime import datetime
+from uuid import UUID
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessageKeysetPagination(LimitOffsetPagination):
+    """
+    Keyset (cursor) pagination over (created_at, id) for message history.
+
+        ?before=            newest page
+        ?before=<cursor>    messages older than the cursor
+        ?after=<cursor>     messages newer than the cursor
+        ?page_size=N
+
+    Pages are always returned old → new (WhatsApp order). Cost does not
+    grow with depth, and pages stay stable while new messages arrive.
+    Without before/after this is plain LimitOffsetPagination (old clients).
+    """
+
+    page_size = 50
+    max_page_size = 200
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+
+        self.keyset = "before" in params or "after" in params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        size = self.get_keyset_page_size(request)
+
+        if "after" in params:
+            created_at, pk = self.decode_cursor(params["after"])
+            page = list(
+                queryset.filter(
+                    Q(created_at__gt=created_at)
+                    | Q(created_at=created_at, id__gt=pk)
+                ).order_by("created_at", "id")[:size]
+            )
+
+            # Polling: keep handing back a "newer" cursor even when caught up
+            self.newer_cursor = self.encode_cursor(page[-1]) if page else params["after"]
+            self.older_cursor = self.encode_cursor(page[0]) if page else None
+
+        else:
+            query = queryset
+            if params["before"]:
+                created_at, pk = self.decode_cursor(params["before"])
+                query = query.filter(
+                    Q(created_at__lt=created_at)
+                    | Q(created_at=created_at, id__lt=pk)
+                )
+
+            rows = list(query.order_by("-created_at", "-id")[:size + 1])
+            has_older = len(rows) > size
+            page = rows[:size][::-1]
+
+            self.older_cursor = self.encode_cursor(page[0]) if has_older else None
+            self.newer_cursor = self.encode_cursor(page[-1]) if page else None
+
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        return Response({
+            "older": self.build_link("before", self.older_cursor),
+            "newer": self.build_link("after", self.newer_cursor),
+            "results": data,
+        })
+
+    # -------------------- HELPERS --------------------
+
+    def get_keyset_page_size(self, request):
+        try:
+            size = int(request.query_params.get("page_size", self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def build_link(self, param, cursor):
+        if cursor is None:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, "before")
+        url = remove_query_param(url, "after")
+        return replace_query_param(url, param, cursor)
+
+    @staticmethod
+    def encode_cursor(message):
+        raw = f"{message.created_at.isoformat()}|{message.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            created_at, pk = raw.split("|")
+            return datetime.fromisoformat(created_at), UUID(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,345 @@
+"""
+Optional Postgres declarative partitioning for chat history.
+
+Message is range-partitioned by month of created_at. Retention then
+becomes DROP TABLE on a whole month instead of a multi-million-row DELETE.
+
+Django keeps treating `id` as the primary key; in the database the key
+becomes (id, created_at) because Postgres requires the partition column
+in every unique constraint. Tables with other unique indexes are not
+converted (see PartitionError).
+
+MessageReceipt stays a plain table: it keeps its (message, user) unique
+constraint, which partitioning would have to weaken.
+
+Foreign keys that point AT chat_message (receipt → message, member read
+cursor → message) can't survive the conversion and are dropped. ORM
+deletes still emulate on_delete in Python; for DROP TABLE,
+drop_expired_partitions() does it in SQL: receipts of the month are
+deleted and read cursors into it cleared, in the same transaction.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ConversationMember, Message, MessageReceipt, MESSAGE_RETENTION
+
+
+class PartitionError(Exception):
+    pass
+
+
+def partitioned_tables():
+    """
+    db_table → partition column
+    """
+    return {
+        Message._meta.db_table: "created_at",
+    }
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def any_partitioned():
+    return is_supported() and any(is_partitioned(table) for table in partitioned_tables())
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+# --------------------------------------------------
+# MONTH HELPERS
+# --------------------------------------------------
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(dt, months):
+    index = dt.year * 12 + (dt.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y_%m}"
+
+
+def default_partition_name(table):
+    # Catches rows outside every month partition, so INSERTs never fail
+    # if maintenance stops running
+    return f"{table}_default"
+
+
+def existing_partitions(table):
+    """
+    {partition_name: month start} for partitions named by partition_name().
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    prefix = f"{table}_p"
+    partitions = {}
+    for name in names:
+        try:
+            partitions[name] = datetime.strptime(
+                name[len(prefix):], "%Y_%m"
+            ).replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            continue
+    return partitions
+
+
+def insertable_columns(cursor, table):
+    # Generated columns (search_vector) are recomputed, not copied
+    cursor.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+        """,
+        [table],
+    )
+    return ", ".join(f'"{row[0]}"' for row in cursor.fetchall())
+
+
+def create_partition(cursor, table, start):
+    """
+    Create the month partition starting at `start`. Rows of that month
+    already sitting in the DEFAULT partition are moved into it (Postgres
+    refuses the new partition otherwise).
+    """
+    name = partition_name(table, start)
+    end = add_months(start, 1)
+    column = partitioned_tables()[table]
+    default = default_partition_name(table)
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [default])
+    stray = False
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE "{column}" >= %s AND "{column}" < %s)',
+            [start, end],
+        )
+        stray = cursor.fetchone()[0]
+
+    if stray:
+        cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+
+    if stray:
+        columns = insertable_columns(cursor, table)
+        cursor.execute(
+            f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM "{default}" '
+            f'WHERE "{column}" >= %s AND "{column}" < %s',
+            [start, end],
+        )
+        cursor.execute(
+            f'DELETE FROM "{default}" WHERE "{column}" >= %s AND "{column}" < %s',
+            [start, end],
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT')
+
+    return name
+
+
+# --------------------------------------------------
+# MAINTENANCE
+# --------------------------------------------------
+
+def ensure_partitions(months_ahead=None, dry_run=False):
+    """
+    Pre-create partitions from the current month up to `months_ahead`.
+    Returns the names of partitions created (or that would be).
+    """
+    if months_ahead is None:
+        months_ahead = settings.CHAT_PARTITION_MONTHS_AHEAD
+
+    current = month_start(timezone.now())
+    created = []
+
+    for table in partitioned_tables():
+        if not is_partitioned(table):
+            continue
+
+        existing = existing_partitions(table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(months_ahead + 1):
+                start = add_months(current, offset)
+                name = partition_name(table, start)
+                if name in existing:
+                    continue
+                if not dry_run:
+                    create_partition(cursor, table, start)
+                created.append(name)
+
+    return created
+
+
+def drop_expired_partitions(dry_run=False):
+    """
+    Drop whole months whose rows are all past retention.
+    Stands in for the FKs dropped by the conversion: receipts of the
+    month's messages are deleted (CASCADE) and member read cursors
+    pointing into it cleared (SET_NULL) before the DROP, atomically.
+    Returns the names of partitions dropped (or that would be).
+    """
+    # A month [start, end) is expired once end + retention has passed
+    cutoff = timezone.now() - MESSAGE_RETENTION
+    dropped = []
+
+    member_table = ConversationMember._meta.db_table
+    receipt_table = MessageReceipt._meta.db_table
+    message_table = Message._meta.db_table
+
+    for table in partitioned_tables():
+        if not is_partitioned(table):
+            continue
+
+        for name, start in sorted(existing_partitions(table).items(), key=lambda p: p[1]):
+            if add_months(start, 1) > cutoff:
+                continue
+
+            dropped.append(name)
+            if dry_run:
+                continue
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                if table == message_table:
+                    cursor.execute(
+                        f'DELETE FROM "{receipt_table}" '
+                        f'WHERE message_id IN (SELECT id FROM "{name}")'
+                    )
+                    cursor.execute(
+                        f'UPDATE "{member_table}" SET last_read_message_id = NULL, updated_at = now() '
+                        f'WHERE last_read_message_id IN (SELECT id FROM "{name}")'
+                    )
+                cursor.execute(f'DROP TABLE "{name}"')
+
+    return dropped
+
+
+# --------------------------------------------------
+# ONE-TIME CONVERSION
+# --------------------------------------------------
+
+def convert_table(table, column, months_ahead=None):
+    """
+    Rebuild `table` as a partitioned table (maintenance window: copies
+    every row), with monthly partitions plus a DEFAULT one. Outgoing FKs
+    and secondary indexes are recreated. A unique index other than the
+    primary key raises PartitionError: it could not be kept as is.
+    """
+    if months_ahead is None:
+        months_ahead = settings.CHAT_PARTITION_MONTHS_AHEAD
+
+    legacy = f"{table}_legacy"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Secondary indexes to recreate after the copy
+        cursor.execute(
+            """
+            SELECT indexdef FROM pg_indexes
+            WHERE tablename = %s
+              AND indexname NOT IN (
+                  SELECT conname FROM pg_constraint
+                  WHERE conrelid = to_regclass(%s) AND contype = 'p'
+              )
+            """,
+            [table, table],
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+
+        unique = [d for d in index_defs if d.startswith("CREATE UNIQUE INDEX")]
+        if unique:
+            raise PartitionError(
+                f"{table} has unique indexes that partitioning would drop: {unique}"
+            )
+
+        # Outgoing FKs (message → conversation, sender …)
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype = 'f'
+            """,
+            [table],
+        )
+        outgoing_fks = cursor.fetchall()
+
+        # Incoming FKs can't target a partitioned table without the partition column
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE confrelid = to_regclass(%s) AND contype = 'f'
+            """,
+            [table],
+        )
+        for referencing, conname in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT "{conname}"')
+
+        columns = insertable_columns(cursor, table)
+
+        cursor.execute(f'SELECT MIN("{column}") FROM "{table}"')
+        oldest = cursor.fetchone()[0] or timezone.now()
+
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING GENERATED) '
+            f'PARTITION BY RANGE ("{column}")'
+        )
+
+        start = month_start(oldest)
+        last = add_months(month_start(timezone.now()), months_ahead)
+        while start <= last:
+            create_partition(cursor, table, start)
+            start = add_months(start, 1)
+
+        cursor.execute(
+            f'CREATE TABLE "{default_partition_name(table)}" PARTITION OF "{table}" DEFAULT'
+        )
+
+        cursor.execute(f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM "{legacy}"')
+        cursor.execute(f'DROP TABLE "{legacy}"')
+
+        cursor.execute(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, "{column}")'
+        )
+
+        for conname, definition in outgoing_fks:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{conname}" {definition}')
+
+        for index_def in index_defs:
+            cursor.execute(index_def)
+
+
+def convert(months_ahead=None):
+    converted = []
+    for table, column in partitioned_tables().items():
+        if is_partitioned(table):
+            continue
+        convert_table(table, column, months_ahead)
+        converted.append(table)
+    return converted
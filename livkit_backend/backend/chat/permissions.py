@@ -1,5 +1,5 @@
 from rest_framework.permissions import BasePermission
-from .models import ConversationMember
+from .cache import get_membership
 
 
 class IsConversationMember(BasePermission):
@@ -8,8 +8,6 @@ class IsConversationMember(BasePermission):
         if not conversation_id:
             return False
 
-        return ConversationMember.objects.filter(
-            conversation_id=conversation_id,
-            user=request.user,
-            is_banned=False,
-        ).exists()
+        # ✅ Served from the membership cache (LRU → Redis → DB)
+        membership = get_membership(conversation_id, request.user.id)
+        return membership["is_member"] and not membership["is_banned"]
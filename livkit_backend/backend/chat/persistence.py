@@ -0,0 +1,233 @@
+import asyncio
+import atexit
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Q
+
+from .models import Conversation, Message
+from .services import increment_unread
+
+logger = logging.getLogger("chat.persistence")
+
+# Errors caused by the rows themselves (too-long value, sender deleted
+# while buffered…): retrying the same batch can never succeed
+ROW_ERRORS = (DataError, IntegrityError)
+
+
+def write_messages(messages):
+    """
+    Persist a batch of unsaved Message instances.
+
+    One bulk INSERT for the whole batch, then one last_message_at and
+    one unread_count UPDATE per conversation (instead of per message
+    in Message.save()).
+    Returns the number of rows written.
+    """
+    conversation_ids = {m.conversation_id for m in messages}
+
+    # Drop messages whose conversation was deleted while they were buffered,
+    # otherwise one bad row would fail the whole batch forever.
+    existing = set(
+        Conversation.objects.filter(
+            id__in=conversation_ids
+        ).values_list("id", flat=True)
+    )
+    messages = [m for m in messages if m.conversation_id in existing]
+
+    if not messages:
+        return 0
+
+    latest = {}
+    for message in messages:
+        message.set_expiry()
+        current = latest.get(message.conversation_id)
+        if current is None or message.created_at > current:
+            latest[message.conversation_id] = message.created_at
+
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+
+        for conversation_id, created_at in latest.items():
+            # Never move ordering backwards
+            Conversation.objects.filter(
+                Q(last_message_at__isnull=True) | Q(last_message_at__lt=created_at),
+                id=conversation_id,
+            ).update(last_message_at=created_at)
+
+        increment_unread(messages)
+
+    return len(messages)
+
+
+def write_messages_isolating(messages):
+    """
+    write_messages(), but a batch rejected because of its rows is split
+    in halves until the bad rows are isolated, and those are dropped.
+    Other errors (DB down…) propagate so the caller keeps the batch.
+    Returns (rows written, rows rejected).
+    """
+    try:
+        return write_messages(messages), 0
+    except ROW_ERRORS:
+        if len(messages) == 1:
+            logger.exception("Write-behind dropped message %s", messages[0].id)
+            return 0, 1
+
+    middle = len(messages) // 2
+    written_a, rejected_a = write_messages_isolating(messages[:middle])
+    written_b, rejected_b = write_messages_isolating(messages[middle:])
+    return written_a + written_b, rejected_a + rejected_b
+
+
+class MessageWriteBehind:
+    """
+    Per-process write-behind buffer for chat messages.
+
+    ChatConsumer broadcasts immediately (the UUID id is assigned in
+    Python, not by the DB) and hands the unsaved Message here. A background
+    task flushes the buffer every `flush_interval` seconds. The buffer is
+    bounded: when `max_pending` is reached the sender flushes inline
+    (backpressure), and if the DB keeps failing the oldest rows are dropped.
+    Rows the DB rejects (see ROW_ERRORS) are dropped on their own, so one
+    bad message never holds back the rest of the buffer.
+    """
+
+    def __init__(self, flush_interval=0.5, max_pending=5000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending = []
+        self._flush_lock = None
+        self._task = None
+
+        self.counters = {
+            "submitted": 0,
+            "flushes": 0,
+            "flushed_messages": 0,
+            "flush_errors": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+            "total_flush_seconds": 0.0,
+        }
+
+    # -------------------- PRODUCER --------------------
+
+    async def submit(self, message):
+        self._ensure_started()
+
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+        self._pending.append(message)
+        self.counters["submitted"] += 1
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    # -------------------- FLUSH --------------------
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                written, rejected = await database_sync_to_async(
+                    write_messages_isolating
+                )(batch)
+            except Exception:
+                logger.exception("Write-behind flush failed (%d messages)", len(batch))
+                self.counters["flush_errors"] += 1
+                # Keep ordering: failed batch goes back in front
+                self._pending[:0] = batch
+                self._trim()
+                return 0
+
+            self._record(written, rejected, time.monotonic() - started)
+            return written
+
+    def flush_sync(self):
+        """
+        Drain the buffer without an event loop (process shutdown).
+        """
+        batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        started = time.monotonic()
+        try:
+            written, rejected = write_messages_isolating(batch)
+        except Exception:
+            logger.exception("Write-behind shutdown flush failed (%d messages)", len(batch))
+            self.counters["flush_errors"] += 1
+            return 0
+
+        self._record(written, rejected, time.monotonic() - started)
+        logger.info("Write-behind shutdown flush: %s", self.stats())
+        return written
+
+    def stats(self):
+        return {**self.counters, "pending": self.pending}
+
+    # -------------------- INTERNALS --------------------
+
+    def _record(self, size, rejected, seconds):
+        c = self.counters
+        c["rejected"] += rejected
+        c["flushes"] += 1
+        c["flushed_messages"] += size
+        c["last_flush_size"] = size
+        c["max_flush_size"] = max(c["max_flush_size"], size)
+        c["last_flush_seconds"] = seconds
+        c["max_flush_seconds"] = max(c["max_flush_seconds"], seconds)
+        c["total_flush_seconds"] += seconds
+
+        # Totals ride along so a log search shows the loss so far
+        logger.log(
+            logging.WARNING if rejected else logging.DEBUG,
+            "Write-behind flushed %d messages (%d rejected) in %.4fs; "
+            "totals: written=%d rejected=%d dropped=%d",
+            size, rejected, seconds,
+            c["flushed_messages"], c["rejected"], c["dropped"],
+        )
+
+    def _trim(self):
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.counters["dropped"] += overflow
+            logger.error(
+                "Write-behind buffer full, dropped %d messages (%d dropped in total)",
+                overflow, self.counters["dropped"],
+            )
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+write_behind = MessageWriteBehind(
+    flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_WRITE_BEHIND_MAX_PENDING,
+)
+
+atexit.register(write_behind.flush_sync)
@@ -1,8 +1,14 @@
 # chat/routing.py
 from django.urls import re_path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, MultiplexChatConsumer
 
 websocket_urlpatterns = [
+    # One socket per user, subscribe to many conversations
+    re_path(
+        r"ws/chat/$",
+        MultiplexChatConsumer.as_asgi(),
+    ),
+    # One socket per conversation (older clients)
     re_path(
         r"ws/chat/(?P<conversation_id>[0-9a-fA-F\-]+)/$",
         ChatConsumer.as_asgi(),
@@ -0,0 +1,243 @@
+"""
+Full-text search over Message.content["text"], one conversation at a time.
+
+Postgres: generated `search_vector` tsvector column + GIN index.
+SQLite:   FTS5 table `chat_message_fts`, kept in step by triggers
+          (re-created after migrate: table rebuilds drop them).
+Both are maintained by the database itself, so ORM saves, bulk_create
+(write-behind) and queryset.update() edits are all indexed.
+Other databases fall back to an unindexed icontains scan.
+"""
+import re
+from html import escape
+
+from django.db import DatabaseError, connection, connections, transaction
+from django.utils import timezone
+
+from .models import Message
+
+SEARCH_CONFIG = "simple"  # no stemming: chat text is multilingual / slang
+FTS_TABLE = "chat_message_fts"
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+SNIPPET_WORDS = 12
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_messages(conversation_id, query, limit=20):
+    """
+    Visible (not deleted, not expired) messages matching `query`, best
+    first. Returns [(message, rank, snippet)]; snippets mark hits with
+    <mark>…</mark> around otherwise HTML-escaped text.
+    """
+    words = WORD_RE.findall(query.lower())
+    if not words:
+        return []
+
+    if connection.vendor == "postgresql":
+        hits = _search_postgres(conversation_id, query, limit)
+    elif connection.vendor == "sqlite" and _has_fts_table():
+        hits = _search_sqlite(conversation_id, words, limit)
+    else:
+        hits = _search_fallback(conversation_id, words, limit)
+
+    messages = Message.objects.select_related("sender").in_bulk([pk for pk, _, _ in hits])
+    return [
+        (messages[pk], rank, snippet)
+        for pk, rank, snippet in hits
+        if pk in messages
+    ]
+
+
+# -------------------- POSTGRES --------------------
+
+def _search_postgres(conversation_id, query, limit):
+    table = Message._meta.db_table
+
+    # ts_headline is costly: only run it on the page that is returned
+    sql = f"""
+        SELECT id, rank, ts_headline(
+            %s, content->>'text', q,
+            'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords={SNIPPET_WORDS}, MinWords=3'
+        )
+        FROM (
+            SELECT id, content, q, ts_rank(search_vector, q) AS rank, created_at
+            FROM "{table}", websearch_to_tsquery(%s, %s) AS q
+            WHERE conversation_id = %s
+              AND search_vector @@ q
+              AND NOT is_deleted
+              AND expires_at > %s
+            ORDER BY rank DESC, created_at DESC
+            LIMIT %s
+        ) AS hits
+        ORDER BY rank DESC, created_at DESC
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            SEARCH_CONFIG,
+            SEARCH_CONFIG, query,
+            conversation_id,
+            connection.ops.adapt_datetimefield_value(timezone.now()),
+            limit,
+        ])
+        # ts_headline doesn't escape the text around the hits
+        return [
+            (pk, rank, _escape_marked(snippet or ""))
+            for pk, rank, snippet in cursor.fetchall()
+        ]
+
+
+def _escape_marked(snippet):
+    parts = re.split(f"({re.escape(HIGHLIGHT_START)}|{re.escape(HIGHLIGHT_STOP)})", snippet)
+    return "".join(
+        part if part in (HIGHLIGHT_START, HIGHLIGHT_STOP) else escape(part)
+        for part in parts
+    )
+
+
+# -------------------- SQLITE (FTS5) --------------------
+
+FTS_TRIGGERS = {
+    "chat_message_fts_insert": (
+        "AFTER INSERT ON {table} BEGIN "
+        "INSERT INTO {fts} (message_id, conversation_id, text) "
+        "VALUES (new.id, new.conversation_id, json_extract(new.content, '$.text')); "
+        "END"
+    ),
+    "chat_message_fts_update": (
+        "AFTER UPDATE OF content ON {table} BEGIN "
+        "DELETE FROM {fts} WHERE message_id = old.id; "
+        "INSERT INTO {fts} (message_id, conversation_id, text) "
+        "VALUES (new.id, new.conversation_id, json_extract(new.content, '$.text')); "
+        "END"
+    ),
+    "chat_message_fts_delete": (
+        "AFTER DELETE ON {table} BEGIN "
+        "DELETE FROM {fts} WHERE message_id = old.id; "
+        "END"
+    ),
+}
+
+
+def _fts_objects(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE "
+        "(type = 'table' AND name = %s) OR (type = 'trigger' AND name IN (%s, %s, %s))",
+        [FTS_TABLE, *FTS_TRIGGERS],
+    )
+    return {name for (name,) in cursor.fetchall()}
+
+
+def _has_fts_table():
+    # Without every trigger the index is stale: scan instead
+    with connection.cursor() as cursor:
+        return _fts_objects(cursor) == {FTS_TABLE, *FTS_TRIGGERS}
+
+
+def ensure_sqlite_fts(using="default", **kwargs):
+    """
+    post_migrate: SQLite drops a table's triggers whenever a migration
+    rebuilds it (most AlterField / RemoveField on chat_message). Put
+    them back and reindex, since writes in between weren't indexed.
+    """
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return
+
+    table = Message._meta.db_table
+    with conn.cursor() as cursor:
+        present = _fts_objects(cursor)
+        if FTS_TABLE not in present:
+            return  # FTS5 unavailable (see migration 0010): fallback scan
+        missing = [name for name in FTS_TRIGGERS if name not in present]
+        if not missing:
+            return
+
+        try:
+            with transaction.atomic(using=using):
+                for name in missing:
+                    body = FTS_TRIGGERS[name].format(table=table, fts=FTS_TABLE)
+                    cursor.execute(f"CREATE TRIGGER {name} {body}")
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (message_id, conversation_id, text) "
+                    f"SELECT id, conversation_id, json_extract(content, '$.text') FROM {table}"
+                )
+        except DatabaseError as e:
+            print(f"⚠️ Could not restore message search triggers: {e}")
+            return
+
+    print(f"🔹 Restored message search triggers: {', '.join(missing)}")
+
+
+def _search_sqlite(conversation_id, words, limit):
+    table = Message._meta.db_table
+
+    # Every word quoted: user input never reaches FTS5 query syntax
+    match = " ".join(f'"{word}"' for word in words)
+
+    # bm25(): lower is better; exposed as a higher-is-better rank
+    sql = f"""
+        SELECT m.id, -bm25({FTS_TABLE}), snippet({FTS_TABLE}, 2, %s, %s, '…', %s)
+        FROM {FTS_TABLE}
+        JOIN "{table}" AS m ON m.id = {FTS_TABLE}.message_id
+        WHERE {FTS_TABLE} MATCH %s
+          AND {FTS_TABLE}.conversation_id = %s
+          AND NOT m.is_deleted
+          AND m.expires_at > %s
+        ORDER BY bm25({FTS_TABLE}), m.created_at DESC
+        LIMIT %s
+    """
+    params = [
+        "\x01", "\x02", SNIPPET_WORDS,
+        match,
+        conversation_id.hex,
+        connection.ops.adapt_datetimefield_value(timezone.now()),
+        limit,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            (Message._meta.pk.to_python(pk), rank, _mark(snippet))
+            for pk, rank, snippet in cursor.fetchall()
+        ]
+
+
+def _mark(snippet):
+    # Placeholders survive escaping, then become the real tags
+    return (
+        escape(snippet or "")
+        .replace("\x01", HIGHLIGHT_START)
+        .replace("\x02", HIGHLIGHT_STOP)
+    )
+
+
+# -------------------- FALLBACK --------------------
+
+def _search_fallback(conversation_id, words, limit):
+    messages = Message.objects.filter(
+        conversation_id=conversation_id,
+        is_deleted=False,
+        expires_at__gt=timezone.now(),
+    )
+    for word in words:
+        messages = messages.filter(content__text__icontains=word)
+
+    hits = []
+    for pk, content in messages.order_by("-created_at").values_list("id", "content")[:limit]:
+        text = (content or {}).get("text") or ""
+        hits.append((pk, 0.0, _highlight(text, words)))
+    return hits
+
+
+def _highlight(text, words):
+    pattern = re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+    out, last = [], 0
+    for hit in pattern.finditer(text):
+        out.append(escape(text[last:hit.start()]))
+        out.append(HIGHLIGHT_START + escape(hit.group()) + HIGHLIGHT_STOP)
+        last = hit.end()
+    out.append(escape(text[last:]))
+    return "".join(out)
@@ -63,6 +63,7 @@ class MessageSerializer(serializers.ModelSerializer):
 class ConversationSerializer(serializers.ModelSerializer):
     members = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
@@ -74,16 +75,37 @@ class ConversationSerializer(serializers.ModelSerializer):
             "last_message_at",
             "members",
             "last_message",
+            "unread_count",
         )
 
     def get_members(self, obj):
-        members = obj.members.select_related("user")
+        # ✅ uses the view's prefetch (members + users) when present
+        members = obj.members.all()
         return UserMiniSerializer(
             [m.user for m in members],
             many=True
         ).data
 
+    def get_unread_count(self, obj):
+        # ✅ read from the prefetched members, no extra query
+        request = self.context.get("request")
+        if not request or not request.user.is_authenticated:
+            return 0
+
+        for member in obj.members.all():
+            if member.user_id == request.user.id:
+                return member.unread_count
+        return 0
+
     def get_last_message(self, obj):
+        # ✅ batch-loaded by the view: {conversation_id: Message}
+        last_messages = self.context.get("last_messages")
+        if last_messages is not None:
+            msg = last_messages.get(obj.id)
+            if not msg:
+                return None
+            return MessageSerializer(msg, context=self.context).data
+
         # ✅ ignore deleted or expired messages
         msg = (
             obj.messages
@@ -102,3 +124,115 @@ class ConversationSerializer(serializers.ModelSerializer):
             msg,
             context=self.context
         ).data
+
+
+# --------------------------------------------------
+# FAST PATH (HOT READ ENDPOINTS)
+# --------------------------------------------------
+# Plain-dict equivalents of MessageSerializer / ConversationSerializer,
+# built from values_list() rows. Key order and value formats match the
+# serializers exactly, so the rendered JSON is byte-identical.
+# `manage.py bench_serializers` checks that and measures the speedup.
+
+MESSAGE_ROW_FIELDS = (
+    "id",
+    "conversation_id",
+    "sender_id",
+    "sender__username",
+    "type",
+    "content",
+    "created_at",
+    "edited_at",
+    "is_deleted",
+)
+
+CONVERSATION_ROW_FIELDS = (
+    "id",
+    "type",
+    "title",
+    "created_at",
+    "last_message_at",
+)
+
+
+def format_datetime(value):
+    """
+    Same output as DRF's DateTimeField (ISO 8601, current timezone, Z for UTC).
+    """
+    if value is None:
+        return None
+
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def message_row(message):
+    """
+    Message instance (sender selected) → row with MESSAGE_ROW_FIELDS values.
+    """
+    return (
+        message.id,
+        message.conversation_id,
+        message.sender_id,
+        message.sender.username if message.sender_id else None,
+        message.type,
+        message.content,
+        message.created_at,
+        message.edited_at,
+        message.is_deleted,
+    )
+
+
+def message_to_dict(row, user_id=None):
+    (pk, conversation_id, sender_id, sender_username,
+     type_, content, created_at, edited_at, is_deleted) = row
+
+    data = {
+        "id": str(pk),
+        "conversation": conversation_id,
+        "sender": None,
+    }
+
+    # DRF skips sender_id (not nullable) when there is no sender
+    if sender_id is not None:
+        data["sender"] = {"id": sender_id, "username": sender_username}
+        data["sender_id"] = sender_id
+
+    data["is_mine"] = user_id is not None and sender_id == user_id
+    data["type"] = type_
+    data["content"] = content
+    data["created_at"] = format_datetime(created_at)
+    data["edited_at"] = format_datetime(edited_at)
+    data["is_deleted"] = is_deleted
+
+    return data
+
+
+def conversation_to_dict(row, members, last_message, user_id=None):
+    """
+    `members`: [(user_id, username, unread_count)]
+    `last_message`: message row or None
+    """
+    pk, type_, title, created_at, last_message_at = row
+
+    unread_count = 0
+    for member_id, _, count in members:
+        if member_id == user_id:
+            unread_count = count
+            break
+
+    return {
+        "id": str(pk),
+        "type": type_,
+        "title": title,
+        "created_at": format_datetime(created_at),
+        "last_message_at": format_datetime(last_message_at),
+        "members": [
+            {"id": member_id, "username": username}
+            for member_id, username, _ in members
+        ],
+        "last_message": message_to_dict(last_message, user_id) if last_message else None,
+        "unread_count": unread_count,
+    }
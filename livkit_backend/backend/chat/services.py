@@ -0,0 +1,382 @@
+import hashlib
+import sys
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Case, Count, DateTimeField, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When, Window,
+)
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from .models import Conversation, ConversationMember, FriendRequest, Friendship, Message
+
+User = get_user_model()
+
+# Read cursor of a member who has never read anything
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Created by accounts migration 0007 when pg_trgm is available
+USERNAME_TRIGRAM_INDEX = "accounts_user_username_lower_trgm"
+
+_trigram_index = {}
+
+
+def advance_read_cursor(conversation_id, user_id, message_id=None):
+    """
+    High-water-mark read state.
+
+    Moves ConversationMember.last_read_message forward to `message_id`
+    (or to the latest message when omitted) in a single UPDATE.
+    The cursor never moves backwards. unread_count is recomputed in the
+    same statement from the messages after the new cursor.
+
+    Returns the target Message if the cursor advanced, else None.
+    """
+    messages = Message.objects.filter(
+        conversation_id=conversation_id,
+        is_deleted=False,
+    ).only("id", "created_at")
+
+    try:
+        if message_id:
+            target = messages.filter(id=message_id).first()
+        else:
+            target = messages.order_by("-created_at").first()
+    except (ValueError, ValidationError):
+        return None
+
+    if not target:
+        return None
+
+    updated = ConversationMember.objects.filter(
+        conversation_id=conversation_id,
+        user_id=user_id,
+    ).filter(
+        Q(last_read_message__isnull=True)
+        | Q(last_read_message__created_at__lt=target.created_at)
+    ).update(
+        last_read_message=target,
+        unread_count=unread_after(target.created_at),
+        updated_at=timezone.now(),
+    )
+
+    return target if updated else None
+
+
+def unread_after(created_at=None):
+    """
+    Subquery for a ConversationMember UPDATE: messages in the member's
+    conversation newer than `created_at`, not sent by the member.
+    Without `created_at` the member's own read cursor is used.
+    """
+    if created_at is None:
+        cursor = Message.objects.filter(
+            id=OuterRef(OuterRef("last_read_message_id"))
+        ).values("created_at")[:1]
+        created_at = Coalesce(
+            Subquery(cursor),
+            Value(EPOCH, output_field=DateTimeField()),
+        )
+
+    counted = (
+        Message.objects.filter(
+            conversation_id=OuterRef("conversation_id"),
+            created_at__gt=created_at,
+            is_deleted=False,
+        )
+        .exclude(sender_id=OuterRef("user_id"))
+        .order_by()
+        .values("conversation_id")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def increment_unread(messages):
+    """
+    Bulk-insert counterpart of Message.save(): one UPDATE per
+    conversation adds each member's unread messages (all new messages
+    minus the ones they sent). F() keeps concurrent writers correct.
+    """
+    by_conversation = {}
+    for m in messages:
+        by_conversation.setdefault(m.conversation_id, Counter())[m.sender_id] += 1
+
+    for conversation_id, senders in by_conversation.items():
+        total = sum(senders.values())
+        own = Case(
+            *[
+                When(user_id=sender_id, then=Value(n))
+                for sender_id, n in senders.items()
+                if sender_id is not None
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+        ConversationMember.objects.filter(
+            conversation_id=conversation_id
+        ).update(
+            unread_count=F("unread_count") + total - own,
+            updated_at=timezone.now(),
+        )
+
+
+def reconcile_unread_counts(batch_size=1000):
+    """
+    Recompute unread_count from the read cursor for every member,
+    in primary-key batches. Fixes drift (deletes, expiry, crashes).
+    Returns the number of rows that were wrong.
+    """
+    fixed = 0
+    last_id = None
+
+    while True:
+        batch = ConversationMember.objects.order_by("id")
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+
+        ids = list(batch.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return fixed
+
+        last_id = ids[-1]
+
+        fixed += ConversationMember.objects.filter(id__in=ids).exclude(
+            unread_count=unread_after()
+        ).update(unread_count=unread_after(), updated_at=timezone.now())
+
+
+def last_messages_for(conversation_ids):
+    """
+    Latest visible (not deleted, not expired) message per conversation,
+    in ONE window query. Returns {conversation_id: Message}.
+    """
+    if not conversation_ids:
+        return {}
+
+    messages = (
+        Message.objects.filter(
+            conversation_id__in=conversation_ids,
+            is_deleted=False,
+            expires_at__gt=timezone.now(),
+        )
+        .annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=[F("conversation_id")],
+                order_by=[F("created_at").desc(), F("id").desc()],
+            )
+        )
+        .filter(row_number=1)
+        .select_related("sender")
+    )
+
+    return {m.conversation_id: m for m in messages}
+
+
+def get_or_create_private_conversation(user, friend):
+    """
+    Single indexed lookup on the (min_user, max_user) pair key.
+    Concurrent creators race on the unique constraint; the loser
+    returns the winner's conversation.
+    Returns (conversation, created).
+    """
+    low, high = Conversation.private_pair(user.id, friend.id)
+    existing = Conversation.objects.filter(
+        type=Conversation.Type.PRIVATE,
+        min_user_id=low,
+        max_user_id=high,
+    )
+
+    conversation = existing.first()
+    if conversation:
+        return conversation, False
+
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(
+                type=Conversation.Type.PRIVATE,
+                title=f"{user.username} & {friend.username}",
+                created_by=user,
+                min_user_id=low,
+                max_user_id=high,
+            )
+            ConversationMember.objects.bulk_create([
+                ConversationMember(conversation=conversation, user=user),
+                ConversationMember(conversation=conversation, user=friend),
+            ])
+    except (IntegrityError, ValidationError):
+        # Lost the race (DB constraint, or full_clean saw the winner)
+        conversation = existing.first()
+        if not conversation:
+            raise
+        return conversation, False
+
+    return conversation, True
+
+
+# --------------------------------------------------
+# FRIENDSHIPS
+# --------------------------------------------------
+
+def friendship_edges(user_id, friend_id):
+    return [
+        Friendship(user_id=user_id, friend_id=friend_id),
+        Friendship(user_id=friend_id, friend_id=user_id),
+    ]
+
+
+def pair_filter(user_id, friend_id):
+    return Q(user_id=user_id, friend_id=friend_id) | Q(user_id=friend_id, friend_id=user_id)
+
+
+def sync_friendship(friend_request):
+    """
+    Mirror one FriendRequest into the Friendship table.
+    Accepted → both edges exist. Otherwise the edges go, unless another
+    accepted request links the same pair (A→B and B→A both accepted).
+    """
+    a, b = friend_request.sender_id, friend_request.receiver_id
+
+    if friend_request.accepted:
+        Friendship.objects.bulk_create(friendship_edges(a, b), ignore_conflicts=True)
+        return
+
+    still_friends = FriendRequest.objects.filter(
+        Q(sender_id=a, receiver_id=b) | Q(sender_id=b, receiver_id=a),
+        accepted=True,
+    ).exists()
+
+    if not still_friends:
+        Friendship.objects.filter(pair_filter(a, b)).delete()
+
+
+def friends_of(user_id):
+    """
+    One indexed query: [{"id", "username", "email"}, ...]
+    """
+    return list(
+        User.objects.filter(friend_of__user_id=user_id)
+        .order_by("friend_of__id")
+        .values("id", "username", "email")
+    )
+
+
+def are_friends(user_id, other_id):
+    return Friendship.objects.filter(user_id=user_id, friend_id=other_id).exists()
+
+
+def rebuild_friendships(batch_size=1000, prune=False):
+    """
+    Backfill edges from accepted FriendRequests. With `prune`, edges
+    without an accepted request behind them are removed too.
+    Returns (created, pruned).
+    """
+    before = Friendship.objects.count()
+
+    batch = []
+    pairs = FriendRequest.objects.filter(accepted=True).values_list("sender_id", "receiver_id")
+    for sender_id, receiver_id in pairs.iterator(chunk_size=batch_size):
+        batch += friendship_edges(sender_id, receiver_id)
+        if len(batch) >= batch_size:
+            Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+
+    created = Friendship.objects.count() - before
+
+    pruned = 0
+    if prune:
+        accepted = FriendRequest.objects.filter(accepted=True)
+        pruned, _ = Friendship.objects.exclude(
+            Exists(accepted.filter(sender_id=OuterRef("user_id"), receiver_id=OuterRef("friend_id")))
+        ).exclude(
+            Exists(accepted.filter(sender_id=OuterRef("friend_id"), receiver_id=OuterRef("user_id")))
+        ).delete()
+
+    return created, pruned
+
+
+# --------------------------------------------------
+# USER SEARCH
+# --------------------------------------------------
+
+def has_username_trigram_index():
+    """
+    Checked once per process (per DB alias).
+    """
+    alias = connection.alias
+    if alias not in _trigram_index:
+        found = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                    [USERNAME_TRIGRAM_INDEX],
+                )
+                found = cursor.fetchone() is not None
+        _trigram_index[alias] = found
+    return _trigram_index[alias]
+
+
+def prefix_range(prefix):
+    """
+    B-tree friendly prefix match: prefix <= value < next_prefix.
+    startswith re-checks rows a linguistic collation lets into the range.
+    """
+    matches = Q(username_lower__startswith=prefix)
+
+    # Bounds past the column length add nothing; startswith keeps the rest
+    bound = prefix[:User._meta.get_field("username_lower").max_length]
+
+    last = ord(bound[-1]) + 1
+    if last > sys.maxunicode or 0xD800 <= last <= 0xDFFF:
+        # No next code point (or a surrogate): startswith alone
+        return matches
+
+    return matches & Q(
+        username_lower__gte=bound,
+        username_lower__lt=bound[:-1] + chr(last),
+    )
+
+
+def find_users(query, limit=10):
+    """
+    Username search, ranked: exact, then prefix, then (Postgres with
+    pg_trgm, 3+ chars) substring matches. Every step is index-backed.
+    Results are cached for a few seconds per normalized query.
+    """
+    q = query.strip().lower()
+    key = "chat:user_search:%d:%s" % (limit, hashlib.sha1(q.encode()).hexdigest())
+
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    users = User.objects.filter(username_lower__isnull=False).values("id", "username", "email")
+
+    if not q:
+        results = list(users.order_by("username_lower")[:limit])
+    else:
+        # Exact match sorts first within its own prefix range
+        prefix = prefix_range(q)
+        results = list(users.filter(prefix).order_by("username_lower")[:limit])
+
+        # Trigrams need 3 characters to narrow anything down
+        if len(results) < limit and len(q) >= 3 and has_username_trigram_index():
+            results += list(
+                users.filter(username_lower__contains=q)
+                .exclude(prefix)
+                .order_by("username_lower")[:limit - len(results)]
+            )
+
+    cache.set(key, results, settings.CHAT_USER_SEARCH_CACHE_TTL)
+    return results
@@ -0,0 +1,30 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_conversation, invalidate_member, invalidate_user
+from .models import Conversation, ConversationMember
+
+# Invalidate after commit: before it, a concurrent lookup still reads the
+# old row and would put the stale entry right back for the full TTL.
+
+
+@receiver([post_save, post_delete], sender=Conversation)
+def invalidate_conversation_cache(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_conversation, instance.id))
+
+
+@receiver([post_save, post_delete], sender=ConversationMember)
+def invalidate_member_cache(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(invalidate_member, instance.conversation_id, instance.user_id)
+    )
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Covers bans and token_version bumps (password reset)
+    transaction.on_commit(partial(invalidate_user, instance.id))
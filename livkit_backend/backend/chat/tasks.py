@@ -0,0 +1,34 @@
+from celery import shared_task
+from django.conf import settings
+
+from . import partitions
+from .services import reconcile_unread_counts
+
+
+@shared_task
+def reconcile_unread(batch_size=1000):
+    """
+    Periodic drift repair for ConversationMember.unread_count.
+    """
+    fixed = reconcile_unread_counts(batch_size=batch_size)
+    print(f"[CHAT] Reconciled unread counters: {fixed} rows fixed")
+    return fixed
+
+
+@shared_task
+def maintain_message_partitions():
+    """
+    Daily: keep upcoming months pre-created and drop expired months.
+    Runs whenever the tables are partitioned (or CHAT_MESSAGE_PARTITIONING
+    is on), so a --convert without the setting still gets new months.
+    Postgres only.
+    """
+    if not partitions.is_supported() or not (
+        settings.CHAT_MESSAGE_PARTITIONING or partitions.any_partitioned()
+    ):
+        return {"created": [], "dropped": []}
+
+    created = partitions.ensure_partitions()
+    dropped = partitions.drop_expired_partitions()
+    print(f"[CHAT] Partitions: created={created} dropped={dropped}")
+    return {"created": created, "dropped": dropped}
@@ -1,3 +1,303 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .events import conversation_group_name
+from .models import MESSAGE_RETENTION, Conversation, ConversationMember, Message
+from .search import FTS_TABLE, _has_fts_table, ensure_sqlite_fts, search_messages
+from .services import find_users
+from .typing import TypingCoalescer
+
+User = get_user_model()
+
+
+class ConversationListQueryCountTests(TestCase):
+    """
+    The chat list must cost the same number of queries however many
+    conversations (members, last messages) the user has.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="owner", email="owner@example.com"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.created = 0
+
+    def add_conversations(self, count):
+        for _ in range(count):
+            self.created += 1
+            other = User.objects.create_user(
+                username=f"member{self.created}",
+                email=f"member{self.created}@example.com",
+            )
+            conversation = Conversation.objects.create(
+                type=Conversation.Type.GROUP,
+                title=f"Group {self.created}",
+                created_by=self.user,
+            )
+            ConversationMember.objects.create(conversation=conversation, user=self.user)
+            ConversationMember.objects.create(conversation=conversation, user=other)
+
+            for sender in (self.user, other):
+                Message.objects.create(
+                    conversation=conversation,
+                    sender=sender,
+                    content={"text": f"hello from {sender.username}"},
+                )
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/chat/conversations/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.created)
+        return len(queries)
+
+    def assert_flat(self):
+        self.add_conversations(3)
+        small = self.list_queries()
+
+        self.add_conversations(6)
+        large = self.list_queries()
+
+        self.assertEqual(small, large)
+
+    @override_settings(CHAT_FAST_SERIALIZERS=False)
+    def test_query_count_is_flat(self):
+        self.assert_flat()
+
+    @override_settings(CHAT_FAST_SERIALIZERS=True)
+    def test_query_count_is_flat_fast_serializers(self):
+        self.assert_flat()
+
+
+class ConversationListConditionalGetTests(TestCase):
+    """
+    A poll answered 304 must turn into a 200 when what the list shows
+    changes without a new message (title edit, deleted or expired last
+    message, other members joining or renaming).
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="poller", email="poller@example.com"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.conversation = Conversation.objects.create(
+            type=Conversation.Type.GROUP,
+            title="Before",
+            created_by=self.user,
+        )
+        ConversationMember.objects.create(conversation=self.conversation, user=self.user)
+        self.message = Message.objects.create(
+            conversation=self.conversation,
+            sender=self.user,
+            content={"text": "hello"},
+        )
+
+    def poll(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get("/api/chat/conversations/", **headers)
+
+    def assert_revalidates(self, change):
+        etag = self.poll()["ETag"]
+        self.assertEqual(self.poll(etag).status_code, 304)
+
+        change()
+
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_title_edit_invalidates(self):
+        def rename():
+            conversation = Conversation.objects.get(id=self.conversation.id)
+            conversation.title = "After"
+            conversation.save()
+
+        data = self.assert_revalidates(rename)
+        self.assertEqual(data[0]["title"], "After")
+
+    def test_soft_deleted_message_invalidates(self):
+        def delete():
+            self.message.is_deleted = True
+            self.message.save()
+
+        self.assert_revalidates(delete)
+
+    def test_member_join_invalidates(self):
+        def join():
+            other = User.objects.create_user(username="joiner", email="joiner@example.com")
+            ConversationMember.objects.create(conversation=self.conversation, user=other)
+
+        data = self.assert_revalidates(join)
+        self.assertEqual(len(data[0]["members"]), 2)
+
+    def test_member_rename_invalidates(self):
+        other = User.objects.create_user(username="renamer", email="renamer@example.com")
+        ConversationMember.objects.create(conversation=self.conversation, user=other)
+
+        def rename():
+            other.username = "renamed"
+            other.save(update_fields=["username"])
+
+        self.assert_revalidates(rename)
+
+    def test_expired_last_message_invalidates(self):
+        later = timezone.now() + MESSAGE_RETENTION + timedelta(minutes=1)
+
+        def expire():
+            # Only the validators see the clock move past expires_at
+            self.clock = mock.patch("chat.conditional.timezone.now", return_value=later)
+            self.clock.start()
+            self.addCleanup(self.clock.stop)
+
+        self.assert_revalidates(expire)
+
+
+class FindUsersPrefixTests(TestCase):
+    """
+    The prefix range must not break on the last code points or on
+    queries longer than a username can be.
+    """
+
+    def setUp(self):
+        for username in ("a\ud7ff", "b\U0010ffff", "c" * 30):
+            User.objects.create_user(username=username, email=f"{len(username)}{username[0]}@example.com")
+
+    def search(self, query):
+        return [user["username"] for user in find_users(query)]
+
+    def test_code_point_edges(self):
+        self.assertEqual(self.search("a\ud7ff"), ["a\ud7ff"])
+        self.assertEqual(self.search("b\U0010ffff"), ["b\U0010ffff"])
+
+    def test_query_longer_than_username(self):
+        self.assertEqual(self.search("c" * 30), ["c" * 30])
+        self.assertEqual(self.search("c" * 31), [])
+
+
+class MessageSearchTests(TestCase):
+    """
+    Search must follow inserts, edits and deletes — on SQLite also
+    after a table rebuild has dropped the FTS triggers.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="searcher", email="searcher@example.com")
+        self.conversation = Conversation.objects.create(
+            type=Conversation.Type.GROUP,
+            title="Search",
+            created_by=self.user,
+        )
+
+    def search(self, query):
+        return [message.id for message, _, _ in search_messages(self.conversation.id, query)]
+
+    def assert_follows_writes(self):
+        message = Message.objects.create(
+            conversation=self.conversation,
+            sender=self.user,
+            content={"text": "meet at the harbour"},
+        )
+        self.assertEqual(self.search("harbour"), [message.id])
+
+        message.content = {"text": "meet at the station"}
+        message.save()
+        self.assertEqual(self.search("harbour"), [])
+        self.assertEqual(self.search("station"), [message.id])
+
+        message_id = message.id
+        message.delete()
+        self.assertEqual(self.search("station"), [])
+
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE message_id = %s", [message_id.hex])
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_follows_writes(self):
+        self.assert_follows_writes()
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite FTS5 triggers")
+    def test_follows_writes_after_triggers_dropped(self):
+        Message.objects.create(
+            conversation=self.conversation,
+            sender=self.user,
+            content={"text": "written while the triggers were gone"},
+        )
+        with connection.cursor() as cursor:
+            for name in ("insert", "update", "delete"):
+                cursor.execute(f"DROP TRIGGER chat_message_fts_{name}")
+        Message.objects.create(
+            conversation=self.conversation,
+            sender=self.user,
+            content={"text": "unindexed triggers gone"},
+        )
+        # Stale index: searched by scan until the triggers are back
+        self.assertFalse(_has_fts_table())
+
+        with mock.patch("builtins.print"):
+            ensure_sqlite_fts()
+
+        self.assertTrue(_has_fts_table())
+        self.assertEqual(len(self.search("gone")), 2)
+        self.assert_follows_writes()
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class TypingCoalescerTests(SimpleTestCase):
+    """
+    A user typing from two sockets stays "typing" until both stop.
+    """
+
+    conversation_id = "00000000-0000-0000-0000-000000000001"
+
+    async def frames(self, layer, channel):
+        frames = []
+        while True:
+            try:
+                event = await asyncio.wait_for(layer.receive(channel), 0.05)
+            except asyncio.TimeoutError:
+                return frames
+            frames.append(json.loads(event["frame"]))
+
+    async def test_stop_waits_for_every_socket(self):
+        layer = get_channel_layer()
+        listener = await layer.new_channel()
+        await layer.group_add(conversation_group_name(self.conversation_id), listener)
+
+        coalescer = TypingCoalescer(window=60)
+
+        coalescer.update(self.conversation_id, "socket-a", "alice", True)
+        coalescer.update(self.conversation_id, "socket-b", "alice", True)
+        await coalescer.flush()
+        self.assertEqual(
+            [frame["users"] for frame in await self.frames(layer, listener)],
+            [[{"user": "alice", "is_typing": True}]],
+        )
+
+        coalescer.update(self.conversation_id, "socket-a", "alice", False)
+        await coalescer.flush()
+        self.assertEqual(await self.frames(layer, listener), [])
+
+        coalescer.update(self.conversation_id, "socket-b", "alice", False)
+        await coalescer.flush()
+        self.assertEqual(
+            [frame["users"] for frame in await self.frames(layer, listener)],
+            [[{"user": "alice", "is_typing": False}]],
+        )
+        coalescer._task.cancel()
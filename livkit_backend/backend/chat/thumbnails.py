@@ -0,0 +1,37 @@
+"""
+Thumbnail generation. Runs inside worker processes, so this module
+imports Pillow only: no Django, no settings, cheap to spawn.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+
+def make_thumbnails(source_path, sizes, quality=80):
+    """
+    Writes <source stem>_<size>.webp next to the source for each size
+    (longest side), atomically. Returns (width, height, {size: path}).
+    """
+    stem, _ = os.path.splitext(source_path)
+    thumbnails = {}
+
+    with Image.open(source_path) as image:
+        # Phones store rotation in EXIF
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        for size in sizes:
+            thumb = image.copy()
+            thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+            path = f"{stem}_{size}.webp"
+            tmp = f"{path}.tmp"
+            thumb.save(tmp, "WEBP", quality=quality)
+            os.replace(tmp, path)
+
+            thumbnails[str(size)] = path
+
+    return width, height, thumbnails
@@ -0,0 +1,72 @@
+import asyncio
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .events import conversation_group_name, typing_group_event
+
+
+class TypingCoalescer:
+    """
+    Per-process, per-conversation typing aggregator.
+
+    Consumers report typing state changes here instead of calling
+    group_send directly. Every `window` seconds each conversation with
+    changes gets at most ONE aggregated "typing" group event.
+
+    State is kept per socket (channel_name): a user is typing while any
+    of their sockets is, so closing one tab doesn't announce a stop.
+    Changes that cancel out inside a window (start → stop) and changes
+    that repeat what was already announced are dropped.
+    """
+
+    def __init__(self, window=1.0):
+        self.window = window
+
+        self._typing = {}     # conversation_id -> {channel_name: username}
+        self._announced = {}  # conversation_id -> {usernames announced as typing}
+        self._dirty = set()   # conversation_ids changed since the last flush
+        self._task = None
+
+    def update(self, conversation_id, channel_name, username, is_typing):
+        sockets = self._typing.setdefault(conversation_id, {})
+        if is_typing:
+            sockets[channel_name] = username
+        else:
+            sockets.pop(channel_name, None)
+            if not sockets:
+                del self._typing[conversation_id]
+
+        self._dirty.add(conversation_id)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        channel_layer = get_channel_layer()
+
+        for conversation_id in dirty:
+            typing = set(self._typing.get(conversation_id, {}).values())
+            announced = self._announced.pop(conversation_id, set())
+
+            effective = {username: True for username in typing - announced}
+            effective.update({username: False for username in announced - typing})
+
+            if typing:
+                self._announced[conversation_id] = typing
+
+            if effective:
+                await channel_layer.group_send(
+                    conversation_group_name(conversation_id),
+                    typing_group_event(conversation_id, effective),
+                )
+
+    async def _run(self):
+        # Runs only while there is typing traffic
+        while self._dirty:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+
+typing_coalescer = TypingCoalescer(window=settings.CHAT_TYPING_WINDOW)
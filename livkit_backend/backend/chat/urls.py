@@ -1,5 +1,11 @@
 from django.urls import path
-from .views import ConversationListView, MessageListView
+from .views import (
+    ConversationListView,
+    ImageMessageView,
+    MarkConversationReadView,
+    MessageListView,
+    MessageSearchView,
+)
 from . import views
 
 urlpatterns = [
@@ -8,6 +14,18 @@ urlpatterns = [
         "conversations/<uuid:conversation_id>/messages/",
         MessageListView.as_view(),
     ),
+    path(
+        "conversations/<uuid:conversation_id>/search/",
+        MessageSearchView.as_view(),
+    ),
+    path(
+        "conversations/<uuid:conversation_id>/images/",
+        ImageMessageView.as_view(),
+    ),
+    path(
+        "conversations/<uuid:conversation_id>/read/",
+        MarkConversationReadView.as_view(),
+    ),
 
     path("friend_conversation/", views.get_or_create_friend_conversation, name="friend-conversation"),
 
@@ -1,24 +1,58 @@
 from rest_framework import generics, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-
-from .models import Conversation, ConversationMember, Message
-from .serializers import ConversationSerializer, MessageSerializer
+from rest_framework.views import APIView
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .models import ChatImage, Conversation, ConversationMember, Message
+from .serializers import (
+    CONVERSATION_ROW_FIELDS,
+    MESSAGE_ROW_FIELDS,
+    ConversationSerializer,
+    MessageSerializer,
+    conversation_to_dict,
+    message_row,
+    message_to_dict,
+)
 from .permissions import IsConversationMember
-
-from rest_framework.pagination import LimitOffsetPagination
+from .services import (
+    advance_read_cursor,
+    are_friends,
+    find_users,
+    friends_of,
+    get_or_create_private_conversation,
+    last_messages_for,
+    sync_friendship,
+)
+from .events import (
+    conversation_group_name,
+    conversation_new_group_event,
+    message_read_group_event,
+    user_group_name,
+)
+
+from .conditional import ConditionalGetMixin, chat_list_validators, history_validators
+from .images import HashingUploadHandler, ImageRejected, store_image, submit_image_message
+from .pagination import MessageKeysetPagination
+from .search import search_messages
 
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError
 
 from django.views.decorators.csrf import csrf_exempt
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET, require_POST
 import json
 
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 
 from .models import FriendRequest
@@ -44,26 +78,17 @@ def get_or_create_friend_conversation(request):
     if not friend:
         return Response({"detail": "Friend not found"}, status=404)
 
-    # Check if conversation exists
-    conversation = (
-        Conversation.objects.filter(
-            type=Conversation.Type.PRIVATE,  # make sure 'PRIVATE' exists in Type
-            members__user=user
-        ).filter(members__user=friend)
-        .first()
-    )
+    # ✅ Indexed get-or-create on the canonical user pair (race-safe)
+    conversation, created = get_or_create_private_conversation(user, friend)
 
-    # Create if not exists
-    if not conversation:
-        conversation = Conversation.objects.create(
-            type=Conversation.Type.PRIVATE,
-            title=f"{user.username} & {friend.username}",
-            created_by=user
-        )
-        ConversationMember.objects.bulk_create([
-            ConversationMember(conversation=conversation, user=user),
-            ConversationMember(conversation=conversation, user=friend),
-        ])
+    if created:
+        # 🔔 Multiplexed sockets of both users can subscribe right away
+        channel_layer = get_channel_layer()
+        for member in (user, friend):
+            async_to_sync(channel_layer.group_send)(
+                user_group_name(member.id),
+                conversation_new_group_event(conversation.id),
+            )
 
     return Response({
         "id": str(conversation.id),
@@ -161,9 +186,13 @@ def respond_request(request):
     accept = data.get("accept")
 
     try:
-        fr = FriendRequest.objects.get(id=fr_id, receiver=user)
-        fr.accepted = accept
-        fr.save()
+        with transaction.atomic():
+            fr = FriendRequest.objects.select_for_update().get(id=fr_id, receiver=user)
+            fr.accepted = accept
+            fr.save()
+
+            # 🔹 Keep the materialized Friendship edges in step
+            sync_friendship(fr)
         return JsonResponse({"success": True})
     except FriendRequest.DoesNotExist:
         return JsonResponse({"error": "Request not found"}, status=404)
@@ -172,11 +201,8 @@ def respond_request(request):
 @require_GET
 def search_users(request):
     q = request.GET.get("q", "")
-    users = User.objects.filter(username__icontains=q)[:10]
-    results = [
-        {"id": u.id, "username": u.username, "email": u.email}
-        for u in users
-    ]
+    # 🔹 Indexed prefix / trigram search (no full scan per keystroke)
+    results = find_users(q, limit=10)
     return JsonResponse({"results": results})
 
 
@@ -210,6 +236,10 @@ def send_friend_request(request):
     except User.DoesNotExist:
         return JsonResponse({"error": "User not found"}, status=404)
 
+    # ✅ Either direction: one indexed lookup on the Friendship edges
+    if are_friends(sender.id, receiver.id):
+        return JsonResponse({"error": "Already friends"}, status=400)
+
     existing = FriendRequest.objects.filter(
         sender=sender,
         receiver=receiver
@@ -231,24 +261,8 @@ def send_friend_request(request):
 def list_friends(request):
     user = request.user
 
-    sent = FriendRequest.objects.filter(sender=user, accepted=True)
-    received = FriendRequest.objects.filter(receiver=user, accepted=True)
-
-    friends = []
-
-    for fr in sent:
-        friends.append({
-            "id": fr.receiver.id,
-            "username": fr.receiver.username,
-            "email": fr.receiver.email,
-        })
-
-    for fr in received:
-        friends.append({
-            "id": fr.sender.id,
-            "username": fr.sender.username,
-            "email": fr.sender.email,
-        })
+    # ✅ One query over the Friendship edges (no per-row user loads)
+    friends = friends_of(user.id)
 
     return JsonResponse({"friends": friends})
 
@@ -257,10 +271,15 @@ def list_friends(request):
 # CHAT: MESSAGE HISTORY (WHATSAPP-STYLE FIX)
 # --------------------------------------------------
 
-class MessageListView(generics.ListAPIView):
+class MessageListView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated, IsConversationMember]
-    pagination_class = LimitOffsetPagination
+    # ?before= / ?after= → keyset over (created_at, id); else limit/offset
+    pagination_class = MessageKeysetPagination
+
+    def get_validators(self, request, conversation_id, **kwargs):
+        # Unchanged polls: 1 query and a 304
+        return history_validators(conversation_id, request.user.id)
 
     def get_queryset(self):
         conversation_id = self.kwargs["conversation_id"]
@@ -278,21 +297,231 @@ class MessageListView(generics.ListAPIView):
             .order_by("created_at")  # 👈 WhatsApp order (old → new)
         )
 
+    def list(self, request, *args, **kwargs):
+        if not settings.CHAT_FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+
+        # ✅ values_list rows → plain dicts (same JSON as MessageSerializer)
+        queryset = self.filter_queryset(self.get_queryset()).values_list(
+            *MESSAGE_ROW_FIELDS, named=True
+        )
+
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        data = [message_to_dict(row, request.user.id) for row in rows]
+
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+
+# --------------------------------------------------
+# CHAT: MESSAGE SEARCH (FULL-TEXT)
+# --------------------------------------------------
+
+class MessageSearchView(APIView):
+    """
+    GET conversations/<id>/search/?q=...&limit=20
+    Ranked full-text hits with highlighted snippets.
+    """
+    permission_classes = [IsAuthenticated, IsConversationMember]
+    max_limit = 50
+
+    def get(self, request, conversation_id):
+        q = request.query_params.get("q", "").strip()
+        if not q:
+            return Response({"detail": "q is required"}, status=400)
+
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 20
+        limit = max(1, min(limit, self.max_limit))
+
+        hits = search_messages(conversation_id, q, limit=limit)
+        context = {"request": request}
+
+        return Response({
+            "results": [
+                {
+                    "message": MessageSerializer(message, context=context).data,
+                    "rank": rank,
+                    "snippet": snippet,
+                }
+                for message, rank, snippet in hits
+            ]
+        })
+
 
 # --------------------------------------------------
-# CHAT LIST (UNCHANGED, ALREADY CORRECT)
+# CHAT: IMAGE MESSAGES
 # --------------------------------------------------
 
-class ConversationListView(generics.ListAPIView):
+class ImageMessageView(APIView):
+    """
+    POST conversations/<id>/images/  (multipart: image, caption?)
+
+    201 {"message": ...}  same image uploaded before (or thumbnails made
+                          inline, CHAT_IMAGE_WORKERS=0): sent right away
+    202 {"image": ...}    thumbnails queued; message.new follows on the WS
+    """
+    permission_classes = [IsAuthenticated, IsConversationMember]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, conversation_id):
+        # ✅ Stream to disk + hash while reading (must be set before parsing)
+        handler = HashingUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+
+        uploaded = request.FILES.get("image")
+        if handler.too_large:
+            return Response({"detail": "Image too large"}, status=413)
+        if not uploaded:
+            return Response({"detail": "image is required"}, status=400)
+
+        try:
+            image = store_image(uploaded, request.user)
+        except ImageRejected as e:
+            return Response({"detail": str(e)}, status=400)
+
+        payload = submit_image_message(
+            image,
+            conversation_id,
+            request.user,
+            caption=request.data.get("caption", ""),
+        )
+
+        if payload:
+            return Response({"message": payload}, status=201)
+
+        # Inline thumbnailing failed (queued images are still PENDING)
+        image.refresh_from_db(fields=["status"])
+        if image.status == ChatImage.Status.FAILED:
+            return Response({"detail": "Image could not be processed"}, status=400)
+
+        return Response(
+            {"image": {"id": image.id, "status": image.status}},
+            status=202,
+        )
+
+
+# --------------------------------------------------
+# CHAT: MARK CONVERSATION READ (READ CURSOR)
+# --------------------------------------------------
+
+class MarkConversationReadView(APIView):
+    """
+    Bulk "mark read": advances the read cursor to `message_id`
+    (or the latest message) — same path as the WS `up_to` event.
+    """
+    permission_classes = [IsAuthenticated, IsConversationMember]
+
+    def post(self, request, conversation_id):
+        message = advance_read_cursor(
+            conversation_id,
+            request.user.id,
+            request.data.get("message_id"),
+        )
+
+        if message:
+            async_to_sync(get_channel_layer().group_send)(
+                conversation_group_name(conversation_id),
+                message_read_group_event(
+                    conversation_id,
+                    str(message.id),
+                    request.user.username,
+                    up_to=True,
+                ),
+            )
+
+        return Response(
+            {
+                "advanced": message is not None,
+                "last_read_message": str(message.id) if message else None,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+# --------------------------------------------------
+# CHAT LIST (CONSTANT QUERY COUNT)
+# --------------------------------------------------
+
+class ConversationListView(ConditionalGetMixin, generics.ListAPIView):
+    """
+    3 queries regardless of how many chats the user has:
+    conversations, members (+ users), last messages (window query).
+    Unchanged polls: 1 query and a 304.
+    """
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_validators(self, request, **kwargs):
+        return chat_list_validators(request.user.id)
+
     def get_queryset(self):
+        my_conversations = ConversationMember.objects.filter(
+            user=self.request.user
+        ).values("conversation_id")
+
         return (
             Conversation.objects.filter(
-                members__user=self.request.user,
+                id__in=my_conversations,
                 is_active=True,
             )
-            .distinct()
+            .prefetch_related(
+                Prefetch(
+                    "members",
+                    queryset=ConversationMember.objects.select_related("user"),
+                )
+            )
             .order_by("-last_message_at")
         )
+
+    def list(self, request, *args, **kwargs):
+        if settings.CHAT_FAST_SERIALIZERS:
+            return self.fast_list(request)
+
+        conversations = list(self.filter_queryset(self.get_queryset()))
+
+        context = self.get_serializer_context()
+        context["last_messages"] = last_messages_for(
+            [c.id for c in conversations]
+        )
+
+        serializer = self.get_serializer_class()(
+            conversations,
+            many=True,
+            context=context,
+        )
+        return Response(serializer.data)
+
+    def fast_list(self, request):
+        """
+        Same 3 queries and same JSON, built from values_list() rows.
+        """
+        rows = list(
+            self.get_queryset()
+            .prefetch_related(None)
+            .values_list(*CONVERSATION_ROW_FIELDS)
+        )
+        ids = [row[0] for row in rows]
+
+        members = {}
+        for conversation_id, user_id, username, unread_count in (
+            ConversationMember.objects.filter(conversation_id__in=ids)
+            .values_list("conversation_id", "user_id", "user__username", "unread_count")
+        ):
+            members.setdefault(conversation_id, []).append((user_id, username, unread_count))
+
+        last_messages = last_messages_for(ids)
+
+        return Response([
+            conversation_to_dict(
+                row,
+                members.get(row[0], []),
+                message_row(last_messages[row[0]]) if row[0] in last_messages else None,
+                request.user.id,
+            )
+            for row in rows
+        ])
@@ -1,9 +1,16 @@
+import logging
+import threading
 import time
+from collections import OrderedDict
+
 from django.conf import settings
-from agora_token_builder import RtcTokenBuilder
+
+from .rtc_tokens import get_builder
+
+logger = logging.getLogger("streaming.agora")
 
 
-def generate_agora_token(channel_name, uid, role):
+def generate_agora_token(channel_name, uid, role, expires_at=None):
     """
     Generates a secure Agora RTC token.
     """
@@ -11,23 +18,154 @@ def generate_agora_token(channel_name, uid, role):
         app_id = settings.AGORA_APP_ID
         app_certificate = settings.AGORA_APP_CERTIFICATE
 
-        expiration_time = 3600  # 1 hour
-        current_timestamp = int(time.time())
-        privilege_expired_ts = current_timestamp + expiration_time
+        if expires_at is None:
+            expires_at = int(time.time()) + settings.AGORA_TOKEN_TTL
+        privilege_expired_ts = expires_at
 
-        token = RtcTokenBuilder.buildTokenWithUid(
-            app_id,
-            app_certificate,
+        # In-tree builder: same bytes as agora_token_builder, faster
+        token = get_builder(app_id, app_certificate).build(
             channel_name,
             uid,
             role,
             privilege_expired_ts
         )
 
-        print("[DEBUG] Agora token generated successfully")
-
         return token
 
-    except Exception as e:
-        print("[ERROR] Agora token generation failed:", e)
+    except Exception:
+        logger.exception("Agora token generation failed")
         raise
+
+
+def generate_agora_tokens(requests, expires_at=None):
+    """
+    Batch: [(channel_name, uid, role), ...] → [token, ...], in order.
+    """
+    if expires_at is None:
+        expires_at = int(time.time()) + settings.AGORA_TOKEN_TTL
+
+    return get_builder(
+        settings.AGORA_APP_ID,
+        settings.AGORA_APP_CERTIFICATE,
+    ).build_many(requests, expires_at)
+
+
+class AgoraTokenCache:
+    """
+    Per-process LRU of tokens keyed by (channel, uid, role).
+
+    A token is reused while it stays valid for at least `refresh_margin`
+    seconds, so clients always get one with that much life left. The
+    LRU bound caps memory (per-viewer join tokens are the bulk of it).
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600, refresh_margin=1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_token(self, channel_name, uid, role):
+        key = (channel_name, uid, role)
+        now = int(time.time())
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] - now >= self.refresh_margin:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Built outside the lock; a concurrent miss just builds it twice
+        expires_at = now + self.ttl
+        token = generate_agora_token(channel_name, uid, role, expires_at=expires_at)
+
+        with self._lock:
+            self._data[key] = (token, expires_at)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+        return token
+
+    def get_tokens(self, keys):
+        """
+        Batch get_token: [(channel_name, uid, role), ...] → [token, ...].
+        Misses are minted together (generate_agora_tokens).
+        """
+        now = int(time.time())
+        tokens = [None] * len(keys)
+        missing = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._data.get(key)
+                if entry is not None and entry[1] - now >= self.refresh_margin:
+                    self._data.move_to_end(key)
+                    tokens[i] = entry[0]
+                else:
+                    missing.append(i)
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if not missing:
+            return tokens
+
+        expires_at = now + self.ttl
+        minted = generate_agora_tokens([keys[i] for i in missing], expires_at=expires_at)
+
+        with self._lock:
+            for i, token in zip(missing, minted):
+                tokens[i] = token
+                self._data[keys[i]] = (token, expires_at)
+                self._data.move_to_end(keys[i])
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+        return tokens
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+token_cache = AgoraTokenCache(
+    maxsize=settings.AGORA_TOKEN_CACHE_SIZE,
+    ttl=settings.AGORA_TOKEN_TTL,
+    refresh_margin=settings.AGORA_TOKEN_REFRESH_MARGIN,
+)
+
+
+def get_agora_token(channel_name, uid, role):
+    """
+    Cached generate_agora_token (see AgoraTokenCache).
+    """
+    return token_cache.get_token(channel_name, uid, role)
+
+
+def get_agora_tokens(keys):
+    """
+    Cached generate_agora_tokens: [(channel_name, uid, role), ...].
+    """
+    return token_cache.get_tokens(keys)
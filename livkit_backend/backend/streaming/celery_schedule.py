@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from celery.schedules import crontab
 
 CELERY_BEAT_SCHEDULE = {
@@ -5,4 +7,9 @@ CELERY_BEAT_SCHEDULE = {
         "task": "streaming.tasks.auto_end_dead_streams",
         "schedule": crontab(minute="*"),
     },
+    "flush-viewer-heartbeats": {
+        "task": "streaming.tasks.flush_viewer_heartbeats",
+        # Well under HEARTBEAT_TIMEOUT, so timeouts are caught promptly
+        "schedule": timedelta(seconds=15),
+    },
 }
@@ -0,0 +1,117 @@
+"""
+Shared live feed snapshot.
+
+Every viewer is served the same snapshot from the shared cache: live
+streams (serialized once, streamers via select_related), their preview
+tokens (uid 0, subscriber: identical for all viewers) and the fallback
+videos. A request costs one cache round-trip whatever the number of
+live streams; pages are slices of the snapshot.
+
+The snapshot is rebuilt when it is older than STREAM_FEED_CACHE_TTL or
+when invalidate_feed() bumped the version (stream created / ended).
+Only one process rebuilds at a time; the others keep serving the
+previous snapshot meanwhile.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .agora import get_agora_tokens
+from .models import FallbackVideo, LiveStream
+from .rtc_tokens import ROLE_SUBSCRIBER
+from .serializers import LiveStreamSerializer
+
+SNAPSHOT_KEY = "stream:feed:snapshot"
+VERSION_KEY = "stream:feed:version"
+REBUILD_LOCK_KEY = "stream:feed:rebuild"
+
+
+def sort_key(stream):
+    """
+    Ascending key for "newest first" order: (-started_at, -id).
+    Cursors are keys, so pages stay consistent across rebuilds.
+    """
+    started = stream.started_at.timestamp() if stream.started_at else 0.0
+    return (-started, -stream.id.int)
+
+
+def build_snapshot(version):
+    streams = sorted(
+        LiveStream.objects.filter(is_live=True).select_related("streamer"),
+        key=sort_key,
+    )
+
+    tokens = get_agora_tokens([
+        (stream.channel_name, 0, ROLE_SUBSCRIBER)
+        for stream in streams
+    ])
+
+    return {
+        "version": version,
+        "built_at": time.time(),
+        "keys": [sort_key(stream) for stream in streams],
+        "streams": list(LiveStreamSerializer(streams, many=True).data),
+        "tokens": tokens,
+        "fallbacks": [
+            {
+                "type": "fallback",
+                "title": video.title,
+                "video_url": video.video_url,
+            }
+            for video in FallbackVideo.objects.filter(is_active=True)
+        ],
+    }
+
+
+def get_snapshot():
+    ttl = settings.STREAM_FEED_CACHE_TTL
+    cached = cache.get_many([SNAPSHOT_KEY, VERSION_KEY])
+    snapshot = cached.get(SNAPSHOT_KEY)
+    version = cached.get(VERSION_KEY, 0)
+
+    if (
+        snapshot is not None
+        and snapshot["version"] == version
+        and time.time() - snapshot["built_at"] < ttl
+    ):
+        return snapshot
+
+    # One rebuild at a time; everyone else serves the stale copy
+    if snapshot is not None and not cache.add(REBUILD_LOCK_KEY, 1, timeout=max(ttl, 5)):
+        return snapshot
+
+    try:
+        snapshot = build_snapshot(version)
+        # Kept past its TTL as the stale copy served during rebuilds
+        cache.set(SNAPSHOT_KEY, snapshot, timeout=ttl * 10)
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+
+    return snapshot
+
+
+def invalidate_feed():
+    """
+    Call when the set of live streams changes. Runs after commit, so the
+    rebuild sees the change.
+    """
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def feed_items(snapshot, start, stop, with_tokens=True):
+    items = snapshot["streams"][start:stop]
+    if not with_tokens:
+        return list(items)
+
+    return [
+        {**item, "agora_token": token}
+        for item, token in zip(items, snapshot["tokens"][start:stop])
+    ]
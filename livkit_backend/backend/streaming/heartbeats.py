@@ -0,0 +1,474 @@
+"""
+Buffered viewer heartbeats.
+
+With STREAM_HEARTBEAT_BUFFER on, a heartbeat touches only the store
+(Redis hash per (stream, viewer), or an in-process dict for tests /
+single-process dev) instead of loading and saving a LiveViewSession.
+
+    stream:hb:<stream>:<viewer>   hash  session, active, last
+    stream:hb:dirty               set   keys changed since the last flush
+    stream:hb:last                zset  key → last heartbeat (epoch)
+
+flush_heartbeats() (beat task) writes the totals back with bulk_update
+and force-ends sessions whose last heartbeat is older than the timeout,
+found from the zset, not by scanning the table. The store holds totals,
+not increments, so a lost or repeated flush never miscounts.
+"""
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import LiveViewSession
+
+HEARTBEAT_INTERVAL = 30  # seconds
+HEARTBEAT_TIMEOUT = 60   # seconds
+
+# Streamer side: auto_end_dead_streams ends streams silent this long
+STREAMER_HEARTBEAT_INTERVAL = 30  # seconds
+STREAMER_HEARTBEAT_TIMEOUT = 90   # seconds
+
+OK = "ok"
+EXPIRED = "expired"
+NO_SESSION = "no_session"
+
+KEY_PREFIX = "stream:hb:"
+DIRTY_KEY = "stream:hb:dirty"
+LAST_KEY = "stream:hb:last"
+
+
+def heartbeat_key(stream_id, viewer_id):
+    return f"{KEY_PREFIX}{stream_id}:{viewer_id}"
+
+
+def to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+# --------------------------------------------------
+# STORES
+# --------------------------------------------------
+# Both stores: state = {"session": id, "active": seconds, "last": epoch}
+
+class LocalHeartbeatStore:
+    """
+    In-process stand-in for RedisHeartbeatStore (tests, runserver).
+    Only correct when the web process also runs flush_heartbeats().
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def track(self, key, session_id, active, last):
+        with self._lock:
+            self._states[key] = {"session": session_id, "active": active, "last": last}
+            self._dirty.discard(key)
+
+    def beat(self, key, now, timeout, step):
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return NO_SESSION, 0
+            if now - state["last"] > timeout:
+                return EXPIRED, state["active"]
+
+            state["active"] += step
+            state["last"] = now
+            self._dirty.add(key)
+            return OK, state["active"]
+
+    def forget(self, key):
+        with self._lock:
+            self._dirty.discard(key)
+            return self._states.pop(key, None)
+
+    def forget_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._dirty.discard(key)
+            return [self._states.pop(key, None) for key in keys]
+
+    def take_dirty(self, limit):
+        with self._lock:
+            taken = []
+            while self._dirty and len(taken) < limit:
+                key = self._dirty.pop()
+                if key in self._states:
+                    taken.append((key, dict(self._states[key])))
+            return taken
+
+    def mark_dirty(self, keys):
+        with self._lock:
+            self._dirty.update(k for k in keys if k in self._states)
+
+    def stale(self, cutoff, limit):
+        with self._lock:
+            found = [
+                (key, dict(state))
+                for key, state in self._states.items()
+                if state["last"] < cutoff
+            ]
+        found.sort(key=lambda item: item[1]["last"])
+        return found[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._dirty.clear()
+
+
+# Check, add and mark dirty in one round-trip, atomically
+BEAT_SCRIPT = """
+local last = redis.call('HGET', KEYS[1], 'last')
+if not last then
+    return {0, 0}
+end
+if tonumber(ARGV[1]) - tonumber(last) > tonumber(ARGV[2]) then
+    return {2, tonumber(redis.call('HGET', KEYS[1], 'active'))}
+end
+local active = redis.call('HINCRBY', KEYS[1], 'active', ARGV[3])
+redis.call('HSET', KEYS[1], 'last', ARGV[1])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('ZADD', KEYS[3], ARGV[1], KEYS[1])
+return {1, active}
+"""
+
+BEAT_RESULTS = {0: NO_SESSION, 1: OK, 2: EXPIRED}
+
+
+class RedisHeartbeatStore:
+    """
+    Shared by every web/worker process. Hashes carry a TTL so state of
+    viewers nobody flushes (flush job down) doesn't pile up forever.
+    """
+
+    def __init__(self, url, ttl=24 * 60 * 60):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self._beat = self.redis.register_script(BEAT_SCRIPT)
+
+    def track(self, key, session_id, active, last):
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={"session": session_id, "active": active, "last": repr(last)})
+        pipe.expire(key, self.ttl)
+        pipe.zadd(LAST_KEY, {key: last})
+        pipe.srem(DIRTY_KEY, key)
+        pipe.execute()
+
+    def beat(self, key, now, timeout, step):
+        code, active = self._beat(
+            keys=[key, DIRTY_KEY, LAST_KEY],
+            args=[repr(now), timeout, step],
+        )
+        if code == 1:
+            self.redis.expire(key, self.ttl)
+        return BEAT_RESULTS[code], int(active or 0)
+
+    def forget(self, key):
+        pipe = self.redis.pipeline()
+        pipe.hgetall(key)
+        pipe.delete(key)
+        pipe.zrem(LAST_KEY, key)
+        pipe.srem(DIRTY_KEY, key)
+        raw = pipe.execute()[0]
+        return self._decode(raw) if raw else None
+
+    def forget_many(self, keys):
+        if not keys:
+            return []
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.hgetall(key)
+        pipe.delete(*keys)
+        pipe.zrem(LAST_KEY, *keys)
+        pipe.srem(DIRTY_KEY, *keys)
+        raws = pipe.execute()[:len(keys)]
+        return [self._decode(raw) if raw else None for raw in raws]
+
+    def take_dirty(self, limit):
+        keys = self.redis.spop(DIRTY_KEY, limit) or []
+        return self._load([k.decode() for k in keys])
+
+    def mark_dirty(self, keys):
+        if keys:
+            self.redis.sadd(DIRTY_KEY, *keys)
+
+    def stale(self, cutoff, limit):
+        keys = self.redis.zrangebyscore(LAST_KEY, "-inf", f"({cutoff!r}", start=0, num=limit)
+        keys = [k.decode() for k in keys]
+        found = self._load(keys)
+
+        # zset entries whose hash already expired
+        gone = set(keys) - {key for key, _ in found}
+        if gone:
+            self.redis.zrem(LAST_KEY, *gone)
+        return found
+
+    def clear(self):
+        keys = list(self.redis.scan_iter(f"{KEY_PREFIX}*"))
+        if keys:
+            self.redis.delete(*keys)
+
+    def _load(self, keys):
+        if not keys:
+            return []
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.hgetall(key)
+        return [
+            (key, self._decode(raw))
+            for key, raw in zip(keys, pipe.execute())
+            if raw
+        ]
+
+    @staticmethod
+    def _decode(raw):
+        return {
+            "session": int(raw[b"session"]),
+            "active": int(raw[b"active"]),
+            "last": float(raw[b"last"]),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def is_enabled():
+    return settings.STREAM_HEARTBEAT_BUFFER in ("local", "redis")
+
+
+def get_store():
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.STREAM_HEARTBEAT_BUFFER == "redis":
+                    _store = RedisHeartbeatStore(settings.REDIS_URL)
+                else:
+                    _store = LocalHeartbeatStore()
+    return _store
+
+
+# --------------------------------------------------
+# VIEWS
+# --------------------------------------------------
+
+def track_session(session):
+    """
+    Start buffering heartbeats for a (new) active session.
+    """
+    if not is_enabled():
+        return
+    get_store().track(
+        heartbeat_key(session.stream_id, session.viewer_id),
+        session.id,
+        session.active_seconds,
+        session.last_heartbeat.timestamp(),
+    )
+
+
+def record_heartbeat(stream_id, viewer_id, interval, timeout):
+    """
+    Returns (OK | EXPIRED | NO_SESSION, active_seconds).
+    Sessions the store doesn't know (joined before buffering was on,
+    store restarted) are loaded from the DB once and tracked from then on.
+    """
+    store = get_store()
+    key = heartbeat_key(stream_id, viewer_id)
+
+    outcome, active = store.beat(key, time.time(), timeout, interval)
+
+    if outcome == NO_SESSION:
+        session = LiveViewSession.objects.filter(
+            stream_id=stream_id,
+            viewer_id=viewer_id,
+            is_active=True,
+            left_at__isnull=True,
+        ).first()
+        if session is None:
+            return NO_SESSION, 0
+
+        track_session(session)
+        outcome, active = store.beat(key, time.time(), timeout, interval)
+
+    if outcome == EXPIRED:
+        state = store.forget(key)
+        if state:
+            end_timed_out([state])
+
+    return outcome, active
+
+
+def take_buffered(session):
+    """
+    Stop buffering `session` and copy its buffered totals onto the
+    instance (caller saves). Used before leave / stream end settles it.
+    """
+    if not is_enabled():
+        return
+    state = get_store().forget(heartbeat_key(session.stream_id, session.viewer_id))
+    if state and state["session"] == session.id:
+        session.active_seconds = max(session.active_seconds, state["active"])
+        session.last_heartbeat = to_datetime(state["last"])
+
+
+def drain_sessions(rows):
+    """
+    Stop buffering [(session_id, stream_id, viewer_id)] and write their
+    buffered totals with one bulk_update. Used before bulk settlement.
+    Returns the number of sessions written.
+    """
+    if not is_enabled() or not rows:
+        return 0
+
+    states = get_store().forget_many(
+        [heartbeat_key(stream_id, viewer_id) for _, stream_id, viewer_id in rows]
+    )
+    sessions = [
+        LiveViewSession(
+            id=session_id,
+            active_seconds=state["active"],
+            last_heartbeat=to_datetime(state["last"]),
+        )
+        for (session_id, _, _), state in zip(rows, states)
+        if state and state["session"] == session_id
+    ]
+    LiveViewSession.objects.bulk_update(sessions, ["active_seconds", "last_heartbeat"])
+    return len(sessions)
+
+
+# --------------------------------------------------
+# FLUSH
+# --------------------------------------------------
+
+def active_session_ids(states):
+    return set(
+        LiveViewSession.objects.filter(
+            id__in=[s["session"] for s in states],
+            is_active=True,
+        ).values_list("id", flat=True)
+    )
+
+
+def flush_dirty(batch_size=1000):
+    """
+    Write buffered active_seconds / last_heartbeat of touched sessions.
+    Returns the number of rows updated.
+    """
+    store = get_store()
+    flushed = 0
+
+    while True:
+        taken = store.take_dirty(batch_size)
+        if not taken:
+            break
+
+        try:
+            # Sessions ended meanwhile keep their settled values
+            active_ids = active_session_ids([state for _, state in taken])
+            sessions = [
+                LiveViewSession(
+                    id=state["session"],
+                    active_seconds=state["active"],
+                    last_heartbeat=to_datetime(state["last"]),
+                )
+                for _, state in taken
+                if state["session"] in active_ids
+            ]
+            LiveViewSession.objects.bulk_update(
+                sessions,
+                ["active_seconds", "last_heartbeat"],
+                batch_size=batch_size,
+            )
+        except Exception:
+            # Totals are still in the store: retry next run
+            store.mark_dirty([key for key, _ in taken])
+            raise
+
+        flushed += len(sessions)
+        if len(taken) < batch_size:
+            break
+
+    return flushed
+
+
+def end_timed_out(states):
+    """
+    Force-end sessions (reason: heartbeat timeout) with their buffered
+    totals, one bulk_update for all of them.
+    """
+    active_ids = active_session_ids(states)
+    now = timezone.now()
+
+    sessions = [
+        LiveViewSession(
+            id=state["session"],
+            active_seconds=state["active"],
+            minutes_watched=state["active"] // 60,
+            last_heartbeat=to_datetime(state["last"]),
+            left_at=now,
+            is_active=False,
+        )
+        for state in states
+        if state["session"] in active_ids
+    ]
+    LiveViewSession.objects.bulk_update(
+        sessions,
+        ["active_seconds", "minutes_watched", "last_heartbeat", "left_at", "is_active"],
+    )
+
+    if sessions:
+        print(
+            f"[ANTI-FRAUD] {len(sessions)} sessions force-ended "
+            f"(reason=heartbeat_timeout)"
+        )
+    return len(sessions)
+
+
+def expire_stale(timeout, batch_size=1000):
+    store = get_store()
+    cutoff = time.time() - timeout
+    ended = 0
+
+    while True:
+        stale = store.stale(cutoff, batch_size)
+        if not stale:
+            break
+
+        states = []
+        for key, _ in stale:
+            state = store.forget(key)
+            if state is None:
+                continue
+            if state["last"] >= cutoff:
+                # A heartbeat landed in between: keep tracking
+                store.track(key, state["session"], state["active"], state["last"])
+                store.mark_dirty([key])
+                continue
+            states.append(state)
+
+        ended += end_timed_out(states)
+
+        if len(stale) < batch_size:
+            break
+
+    return ended
+
+
+def flush_heartbeats(timeout, batch_size=1000):
+    if not is_enabled():
+        return {"flushed": 0, "expired": 0}
+
+    return {
+        "flushed": flush_dirty(batch_size),
+        "expired": expire_stale(timeout, batch_size),
+    }
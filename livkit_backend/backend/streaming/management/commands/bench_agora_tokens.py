@@ -0,0 +1,57 @@
+import time
+
+from agora_token_builder import RtcTokenBuilder
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from streaming.rtc_tokens import ROLE_PUBLISHER, ROLE_SUBSCRIBER, TokenBuilder
+
+
+class Command(BaseCommand):
+    help = "Benchmark the in-tree Agora token builder against agora_token_builder (tokens/s)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tokens", type=int, default=20000)
+        parser.add_argument("--rounds", type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options["tokens"] < 1:
+            raise CommandError("--tokens must be positive")
+
+        app_id = settings.AGORA_APP_ID
+        app_certificate = settings.AGORA_APP_CERTIFICATE
+        builder = TokenBuilder(app_id, app_certificate)
+
+        expire_ts = int(time.time()) + 3600
+        requests = [
+            (f"live_{i % 500}_{1700000000 + i}", i % 7 and i, ROLE_SUBSCRIBER if i % 4 else ROLE_PUBLISHER)
+            for i in range(options["tokens"])
+        ]
+        count = len(requests)
+
+        slow = self._run(options["rounds"], lambda: [
+            RtcTokenBuilder.buildTokenWithUid(app_id, app_certificate, channel, uid, role, expire_ts)
+            for channel, uid, role in requests
+        ])
+        fast = self._run(options["rounds"], lambda: [
+            builder.build(channel, uid, role, expire_ts)
+            for channel, uid, role in requests
+        ])
+        batch = self._run(options["rounds"], lambda: builder.build_many(requests, expire_ts))
+
+        self.stdout.write(f"agora_token_builder {count / slow:>10,.0f} tokens/s")
+        self.stdout.write(f"build()             {count / fast:>10,.0f} tokens/s  x{slow / fast:.1f}")
+        self.stdout.write(f"build_many()        {count / batch:>10,.0f} tokens/s  x{slow / batch:.1f}")
+
+    @staticmethod
+    def _run(rounds, build):
+        """
+        Best of `rounds` (seconds).
+        """
+        best = None
+        for _ in range(rounds):
+            started = time.perf_counter()
+            build()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-18 15:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0008_livestream_last_heartbeat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='livestream',
+            index=models.Index(fields=['is_live', 'last_heartbeat'], name='streaming_l_is_live_29b9b6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='liveviewsession',
+            index=models.Index(fields=['is_active', 'last_heartbeat'], name='streaming_l_is_acti_b758a9_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-18 15:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_settled_at(apps, schema_editor):
+    # Streams ended before settlement existed were settled inline
+    LiveStream = apps.get_model("streaming", "LiveStream")
+    LiveStream.objects.filter(is_live=False).update(
+        settled_at=Coalesce(F("ended_at"), Now())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0009_heartbeat_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livestream',
+            name='settled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_settled_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='livestream',
+            index=models.Index(condition=models.Q(('is_live', False), ('settled_at__isnull', True)), fields=['ended_at'], name='stream_unsettled_idx'),
+        ),
+    ]
@@ -41,6 +41,22 @@ class LiveStream(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     last_heartbeat = models.DateTimeField(null=True, blank=True)
+
+    # Set once viewers are closed and paid (streaming.settlement)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # auto_end_dead_streams
+            models.Index(fields=["is_live", "last_heartbeat"]),
+            # Ended, not yet settled (small): settlement retries
+            models.Index(
+                fields=["ended_at"],
+                name="stream_unsettled_idx",
+                condition=models.Q(is_live=False, settled_at__isnull=True),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.channel_name} ({self.streamer})"
 
@@ -75,6 +91,12 @@ class LiveViewSession(models.Model):
 
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # auto_end_dead_streams (timed-out viewers)
+            models.Index(fields=["is_active", "last_heartbeat"]),
+        ]
+
     def __str__(self):
         return f"{self.viewer} on {self.stream}"
 
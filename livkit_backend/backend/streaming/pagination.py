@@ -0,0 +1,73 @@
+import base64
+from bisect import bisect_right
+
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+
+class FeedCursorPagination:
+    """
+    Cursor pagination over a feed snapshot (streaming.feed), newest first.
+
+        ?page_size=N            first page
+        ?cursor=<c>&page_size=N next page
+
+    The cursor is the sort key of the last item returned, so a stream
+    going live or ending between two requests doesn't shift pages.
+    Without cursor/page_size the whole list is returned (old clients).
+    """
+
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate(self, snapshot, request):
+        """
+        Returns (start, stop) into the snapshot lists, or None when the
+        client didn't ask for pages.
+        """
+        params = request.query_params
+        self.request = request
+        self.next_cursor = None
+
+        if "cursor" not in params and "page_size" not in params:
+            return None
+
+        keys = snapshot["keys"]
+        start = 0
+        if params.get("cursor"):
+            start = bisect_right(keys, self.decode_cursor(params["cursor"]))
+
+        stop = min(start + self.get_page_size(request), len(keys))
+        if stop < len(keys):
+            self.next_cursor = self.encode_cursor(keys[stop - 1])
+
+        return start, stop
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, "cursor", self.next_cursor)
+
+    # -------------------- HELPERS --------------------
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get("page_size", self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(key):
+        raw = f"{key[0]!r}|{key[1]}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            started, stream = raw.split("|")
+            return (float(started), int(stream))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,188 @@
+"""
+Agora RTC token builder (AccessToken "006" format), tuned for volume.
+
+Produces the same bytes as agora_token_builder.RtcTokenBuilder
+(and the in-tree AccessToken.py) for the same salt and timestamp, see
+streaming.tests; `manage.py bench_agora_tokens` compares the speed.
+
+Per token the reference builder re-packs every field with struct.pack,
+concatenates bytes repeatedly, sorts the privilege map and re-keys HMAC.
+Here:
+- struct layouts are compiled once (struct.Struct);
+- the HMAC state keyed with the certificate is built once per
+  certificate and copied per token;
+- the signed message for a (role, expiry) is a fixed layout, packed in
+  one call; the token content is packed into one preallocated buffer.
+"""
+import base64
+import os
+import secrets
+import struct
+import time
+from functools import lru_cache
+from hashlib import sha256
+from zlib import crc32
+
+VERSION = "006"
+
+# Privileges (AccessToken.kJoinChannel …)
+JOIN_CHANNEL = 1
+PUBLISH_AUDIO_STREAM = 2
+PUBLISH_VIDEO_STREAM = 3
+PUBLISH_DATA_STREAM = 4
+
+# Roles (RtcTokenBuilder.Role_*)
+ROLE_ATTENDEE = 0
+ROLE_PUBLISHER = 1
+ROLE_SUBSCRIBER = 2
+ROLE_ADMIN = 101
+
+PUBLISHING_ROLES = {ROLE_ATTENDEE, ROLE_PUBLISHER, ROLE_ADMIN}
+
+# Reference builder: message ts is "now + 24h", salt in [1, 99999999]
+MESSAGE_TS_OFFSET = 24 * 3600
+MAX_SALT = 99999999
+
+SIGNATURE_LENGTH = sha256().digest_size
+
+
+def privileges_for(role):
+    """
+    Privilege ids in ascending order (the order build() sorts them into).
+    """
+    if role in PUBLISHING_ROLES:
+        return (JOIN_CHANNEL, PUBLISH_AUDIO_STREAM, PUBLISH_VIDEO_STREAM, PUBLISH_DATA_STREAM)
+    return (JOIN_CHANNEL,)
+
+
+@lru_cache(maxsize=None)
+def message_struct(privilege_count):
+    # salt:u32 ts:u32 count:u16 then (privilege:u16 expire:u32) * count
+    return struct.Struct("<IIH" + "HI" * privilege_count)
+
+
+@lru_cache(maxsize=None)
+def content_struct(message_length):
+    # signature:string crc_channel:u32 crc_uid:u32 message:string
+    return struct.Struct(f"<H{SIGNATURE_LENGTH}sIIH{message_length}s")
+
+
+@lru_cache(maxsize=32)
+def signer(app_certificate):
+    """
+    HMAC-SHA256 (RFC 2104) inner / outer hash states with the certificate
+    pads already absorbed. Copying two sha256 states per token is cheaper
+    than hmac.new() or even HMAC.copy().
+    """
+    key = app_certificate.encode()
+    block_size = sha256().block_size
+    if len(key) > block_size:
+        key = sha256(key).digest()
+    key = key.ljust(block_size, b"\0")
+
+    inner = sha256(bytes(b ^ 0x36 for b in key))
+    outer = sha256(bytes(b ^ 0x5C for b in key))
+    return inner, outer
+
+
+def uid_string(uid):
+    return "" if uid == 0 else str(uid)
+
+
+class TokenBuilder:
+    """
+    Mints tokens for one (app id, certificate). Reuse one instance.
+    """
+
+    def __init__(self, app_id, app_certificate):
+        self.app_id = app_id
+        self.app_id_bytes = app_id.encode()
+        self._inner, self._outer = signer(app_certificate)
+
+    def build(self, channel_name, uid, role, privilege_expired_ts, salt=None, ts=None):
+        """
+        Same as RtcTokenBuilder.buildTokenWithUid(...). `salt` and `ts`
+        default to the reference builder's random salt / now + 24h.
+        """
+        if ts is None:
+            ts = int(time.time()) + MESSAGE_TS_OFFSET
+        if salt is None:
+            salt = secrets.randbelow(MAX_SALT) + 1
+
+        return self._build(
+            channel_name.encode(),
+            uid_string(uid).encode(),
+            *self._layout(role, privilege_expired_ts),
+            salt,
+            ts,
+        )
+
+    def build_many(self, requests, privilege_expired_ts, ts=None):
+        """
+        Batch: [(channel_name, uid, role), ...] → [token, ...], in order.
+        Timestamp, privilege layouts, encodings and salt entropy are
+        shared by the batch.
+        """
+        if ts is None:
+            ts = int(time.time()) + MESSAGE_TS_OFFSET
+
+        requests = list(requests)
+
+        # One urandom call for the whole batch's salts
+        salts = struct.unpack(f"<{len(requests)}I", os.urandom(4 * len(requests)))
+
+        layouts = {}
+        encoded = {}
+        tokens = []
+
+        for (channel_name, uid, role), salt in zip(requests, salts):
+            layout = layouts.get(role)
+            if layout is None:
+                layout = layouts[role] = self._layout(role, privilege_expired_ts)
+
+            channel = encoded.get(channel_name)
+            if channel is None:
+                channel = encoded[channel_name] = channel_name.encode()
+
+            tokens.append(self._build(
+                channel,
+                uid_string(uid).encode(),
+                *layout,
+                salt % MAX_SALT + 1,
+                ts,
+            ))
+
+        return tokens
+
+    @staticmethod
+    def _layout(role, expire_ts):
+        """
+        (message struct, privilege count, flattened (privilege, expire) pairs)
+        """
+        privileges = privileges_for(role)
+        pairs = tuple(v for privilege in privileges for v in (privilege, expire_ts))
+        return message_struct(len(privileges)), len(privileges), pairs
+
+    def _build(self, channel, uid, message_layout, count, pairs, salt, ts):
+        message = message_layout.pack(salt, ts, count, *pairs)
+
+        inner = self._inner.copy()
+        inner.update(self.app_id_bytes + channel + uid + message)
+        mac = self._outer.copy()
+        mac.update(inner.digest())
+
+        layout = content_struct(len(message))
+        content = bytearray(layout.size)
+        layout.pack_into(
+            content, 0,
+            SIGNATURE_LENGTH, mac.digest(),
+            crc32(channel), crc32(uid),
+            len(message), message,
+        )
+
+        return VERSION + self.app_id + base64.b64encode(content).decode()
+
+
+@lru_cache(maxsize=8)
+def get_builder(app_id, app_certificate):
+    return TokenBuilder(app_id, app_certificate)
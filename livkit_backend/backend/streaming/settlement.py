@@ -0,0 +1,108 @@
+"""
+Stream settlement: close every active view session of an ended stream,
+pay out watch time and add it to the stream's total_earnings.
+
+Minutes and earnings are computed by the database for all sessions in
+one UPDATE, so the statement count is fixed however many viewers there
+are. Session rows are only locked for that one statement, not for the
+whole request.
+
+LiveStream.settled_at is NULL between "stream ended" and "settled";
+large streams are settled by a Celery task meanwhile (status endpoint:
+SettlementStatusView).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Random, Round
+from django.utils import timezone
+
+from . import heartbeats
+from .models import LiveStream, LiveViewSession
+
+MIN_PAYABLE_MINUTES = 2
+
+# Per-session rate, drawn uniformly from this range
+PAY_PER_MINUTE_MIN = 0.05
+PAY_PER_MINUTE_MAX = 0.20
+
+
+def session_earnings():
+    """
+    SQL for: minutes * uniform(MIN, MAX) rounded to cents, 0 below
+    MIN_PAYABLE_MINUTES. Random() runs once per row.
+    """
+    money = DecimalField(max_digits=8, decimal_places=2)
+    minutes = F("active_seconds") / 60
+
+    rate = ExpressionWrapper(
+        Value(PAY_PER_MINUTE_MIN) + Random() * Value(PAY_PER_MINUTE_MAX - PAY_PER_MINUTE_MIN),
+        output_field=FloatField(),
+    )
+    earnings = Round(
+        Cast(ExpressionWrapper(minutes * rate, output_field=FloatField()), money),
+        2,
+    )
+
+    return Case(
+        When(active_seconds__gte=MIN_PAYABLE_MINUTES * 60, then=earnings),
+        default=Value(Decimal("0.00")),
+        output_field=money,
+    )
+
+
+def end_stream(stream):
+    """
+    Mark a locked, live stream as ended (not yet settled).
+    """
+    stream.is_live = False
+    stream.ended_at = timezone.now()
+    stream.settled_at = None
+    stream.save(update_fields=["is_live", "ended_at", "settled_at"])
+
+
+def settle_stream(stream_id):
+    """
+    Settle an ended stream. Idempotent: a settled (or live) stream is
+    left alone. Returns {"sessions", "earnings"} or None.
+    """
+    with transaction.atomic():
+        stream = (
+            LiveStream.objects.select_for_update()
+            .filter(id=stream_id, is_live=False, settled_at__isnull=True)
+            .first()
+        )
+        if stream is None:
+            return None
+
+        sessions = LiveViewSession.objects.filter(stream_id=stream_id, is_active=True)
+
+        # Buffered heartbeats first, so active_seconds is final
+        if heartbeats.is_enabled():
+            heartbeats.drain_sessions(
+                list(sessions.values_list("id", "stream_id", "viewer_id"))
+            )
+
+        now = timezone.now()
+        settled = sessions.update(
+            is_active=False,
+            left_at=now,
+            minutes_watched=F("active_seconds") / 60,
+            earnings_generated=session_earnings(),
+        )
+
+        total = LiveViewSession.objects.filter(
+            stream_id=stream_id,
+            is_active=False,
+            left_at=now,
+        ).aggregate(total=Sum("earnings_generated"))["total"] or Decimal("0.00")
+        total = total.quantize(Decimal("0.01"))
+
+        LiveStream.objects.filter(id=stream_id).update(
+            total_earnings=F("total_earnings") + total,
+            settled_at=now,
+        )
+
+    print(f"[DEBUG] Stream {stream_id} settled: {settled} sessions, earnings {total}")
+    return {"sessions": settled, "earnings": total}
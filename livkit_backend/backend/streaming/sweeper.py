@@ -0,0 +1,143 @@
+"""
+Dead stream / dead session sweeper (streaming.tasks.auto_end_dead_streams).
+
+Everything is set-based: pick up to `batch_size` ids from an index range
+scan, UPDATE them in one statement, repeat at most `max_batches` times.
+A run therefore costs the same on a table of a thousand or a hundred
+million rows; whatever is left is picked up by the next run.
+"""
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from . import heartbeats
+from .models import LiveStream, LiveViewSession
+from .settlement import settle_stream
+
+# A pending settlement older than this lost its worker task: settle here
+SETTLEMENT_RETRY_AFTER = timedelta(minutes=5)
+
+
+def close_in_batches(queryset, values, batch_size, max_batches, fields=("id",)):
+    """
+    UPDATE `queryset` rows with `values`, batch by batch. The filter is
+    re-applied in the UPDATE, so rows that changed meanwhile are skipped.
+    Returns (rows updated, selected rows, more left).
+    """
+    updated = 0
+    selected = []
+
+    for _ in range(max_batches):
+        rows = list(queryset.values_list(*fields)[:batch_size])
+        if not rows:
+            return updated, selected, False
+
+        updated += queryset.filter(id__in=[row[0] for row in rows]).update(**values)
+        selected.extend(rows)
+
+        if len(rows) < batch_size:
+            return updated, selected, False
+
+    return updated, selected, True
+
+
+def ended_session_values(now):
+    return {
+        "is_active": False,
+        "left_at": now,
+        "minutes_watched": F("active_seconds") / 60,
+    }
+
+
+def forget_buffered(rows):
+    # (id, stream_id, viewer_id) rows: stop the buffer answering "ok"
+    if not heartbeats.is_enabled():
+        return
+    store = heartbeats.get_store()
+    for _, stream_id, viewer_id in rows:
+        store.forget(heartbeats.heartbeat_key(stream_id, viewer_id))
+
+
+def sweep(stream_timeout, viewer_timeout, batch_size=500, max_batches=10, sweep_viewers=True):
+    now = timezone.now()
+    report = {"settled": 0, "streams": 0, "ended": [], "sessions": 0, "timed_out": 0, "more": False}
+
+    # 0) Ended streams still waiting for settlement (partial index)
+    stuck = list(
+        LiveStream.objects.filter(
+            is_live=False,
+            settled_at__isnull=True,
+            ended_at__lt=now - SETTLEMENT_RETRY_AFTER,
+        ).values_list("id", flat=True)[:max_batches]
+    )
+    for stream_id in stuck:
+        if settle_stream(stream_id):
+            report["settled"] += 1
+
+    # 1) Streams whose streamer stopped sending heartbeats. Ended like
+    #    EndLiveStreamView does (settled_at stays NULL); the caller
+    #    settles report["ended"], and step 0 catches any it missed. Only
+    #    streams that sent at least one streamer-heartbeat/ are swept:
+    #    clients that never send it keep last_heartbeat NULL.
+    stream_cutoff = now - timedelta(seconds=stream_timeout)
+    dead_streams = LiveStream.objects.filter(
+        is_live=True,
+        last_heartbeat__lt=stream_cutoff,
+    ).order_by("last_heartbeat")
+
+    report["streams"], rows, more = close_in_batches(
+        dead_streams,
+        {"is_live": False, "ended_at": now},
+        batch_size,
+        max_batches,
+    )
+    report["ended"] = [str(stream_id) for stream_id, in rows]
+    report["more"] |= more
+
+    # 2) Viewers still "watching" an ended, settled stream (settlement
+    #    closes them, this catches leftovers). Bounded by the number of
+    #    active sessions, not by history.
+    orphaned = LiveViewSession.objects.filter(
+        is_active=True,
+        stream__is_live=False,
+        stream__settled_at__isnull=False,
+    ).order_by("last_heartbeat")
+
+    report["sessions"], rows, more = close_in_batches(
+        orphaned,
+        ended_session_values(now),
+        batch_size,
+        max_batches,
+        fields=("id", "stream_id", "viewer_id"),
+    )
+    forget_buffered(rows)
+    report["more"] |= more
+
+    if not sweep_viewers:
+        return report
+
+    # 3) Viewers that stopped sending heartbeats. In buffered mode the DB
+    #    is only current right after a flush (the task flushes first).
+    viewer_cutoff = now - timedelta(seconds=viewer_timeout)
+    # Sessions of ended streams awaiting settlement are left to it,
+    # otherwise their viewers would be closed unpaid.
+    timed_out = LiveViewSession.objects.filter(
+        is_active=True,
+        last_heartbeat__lt=viewer_cutoff,
+    ).exclude(
+        stream__is_live=False,
+        stream__settled_at__isnull=True,
+    ).order_by("last_heartbeat")
+
+    report["timed_out"], rows, more = close_in_batches(
+        timed_out,
+        ended_session_values(now),
+        batch_size,
+        max_batches,
+        fields=("id", "stream_id", "viewer_id"),
+    )
+    forget_buffered(rows)
+    report["more"] |= more
+
+    return report
@@ -1 +1,80 @@
+from celery import shared_task
 
+from . import heartbeats, settlement, sweeper
+from .feed import invalidate_feed
+from .heartbeats import HEARTBEAT_TIMEOUT, STREAMER_HEARTBEAT_TIMEOUT
+
+
+@shared_task
+def flush_viewer_heartbeats(batch_size=1000):
+    """
+    Buffered heartbeats → LiveViewSession (bulk_update), and force-end
+    sessions that stopped sending them.
+    No-op unless STREAM_HEARTBEAT_BUFFER is on.
+    """
+    result = heartbeats.flush_heartbeats(HEARTBEAT_TIMEOUT, batch_size=batch_size)
+    if result["flushed"] or result["expired"]:
+        print(
+            f"[STREAM] Heartbeats: flushed={result['flushed']} "
+            f"expired={result['expired']}"
+        )
+    return result
+
+
+@shared_task
+def auto_end_dead_streams(batch_size=500, max_batches=10):
+    """
+    Every minute: end live streams whose streamer went silent (and
+    queue their settlement), close sessions of viewers that went silent.
+    At most batch_size * max_batches rows of each kind per run.
+    """
+    sweep_viewers = True
+    if heartbeats.is_enabled():
+        try:
+            heartbeats.flush_heartbeats(HEARTBEAT_TIMEOUT)
+        except Exception as e:
+            # DB last_heartbeat may be stale: leave viewers alone this run
+            print("[STREAM] Heartbeat flush failed:", e)
+            sweep_viewers = False
+
+    report = sweeper.sweep(
+        stream_timeout=STREAMER_HEARTBEAT_TIMEOUT,
+        viewer_timeout=HEARTBEAT_TIMEOUT,
+        batch_size=batch_size,
+        max_batches=max_batches,
+        sweep_viewers=sweep_viewers,
+    )
+
+    if report["streams"]:
+        invalidate_feed()
+
+    # Pay out viewers of the ended streams, same as EndLiveStreamView
+    # (if queueing fails, the sweeper's settlement retry picks them up)
+    for stream_id in report["ended"]:
+        try:
+            settle_ended_stream.delay(stream_id)
+        except Exception as e:
+            print("[STREAM] Could not queue settlement:", stream_id, e)
+
+    if report["settled"] or report["streams"] or report["sessions"] or report["timed_out"]:
+        print(
+            f"[STREAM] Settlements retried: {report['settled']}, "
+            f"dead streams ended: {report['streams']}, "
+            f"sessions closed: {report['sessions']}, "
+            f"timed-out viewers: {report['timed_out']}"
+            + (" (more left)" if report["more"] else "")
+        )
+    return report
+
+
+@shared_task
+def settle_ended_stream(stream_id):
+    """
+    Background settlement for streams ended with a large audience
+    (EndLiveStreamView answers 202, streamer polls settlement/).
+    """
+    result = settlement.settle_stream(stream_id)
+    if result is None:
+        return None
+    # JSON result: no Decimal
+    return {"sessions": result["sessions"], "earnings": str(result["earnings"])}
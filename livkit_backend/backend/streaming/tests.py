@@ -1,3 +1,80 @@
-from django.test import TestCase
+import struct
+from unittest import mock
 
-# Create your tests here.
+from agora_token_builder import RtcTokenBuilder
+from django.test import SimpleTestCase
+
+from .rtc_tokens import (
+    MAX_SALT,
+    MESSAGE_TS_OFFSET,
+    ROLE_ADMIN,
+    ROLE_ATTENDEE,
+    ROLE_PUBLISHER,
+    ROLE_SUBSCRIBER,
+    TokenBuilder,
+)
+
+APP_ID = "970ca35de60c44645bbae8a215061b33"
+APP_CERTIFICATE = "5cfd2fd1755d40ecb72977518be15d3b"
+
+NOW = 1700000000
+SALT = 12345678
+EXPIRE_TS = NOW + 3600
+
+ROLES = [ROLE_PUBLISHER, ROLE_SUBSCRIBER, ROLE_ATTENDEE, ROLE_ADMIN]
+
+CASES = [
+    ("live_1_1700000000", 0),
+    ("live_1_1700000000", 42),
+    ("live_1_1700000000", 2 ** 32 - 1),
+    ("c", "account-7"),
+    ("канал", 7),
+]
+
+
+class TokenBuilderCompatibilityTests(SimpleTestCase):
+    """
+    The in-tree builder must produce exactly the tokens
+    agora_token_builder.RtcTokenBuilder does for the same salt / ts.
+    """
+
+    def setUp(self):
+        self.builder = TokenBuilder(APP_ID, APP_CERTIFICATE)
+
+    def reference(self, channel, uid, role):
+        # Pin the reference builder's salt (SystemRandom) and clock
+        with mock.patch("agora_token_builder.AccessToken.secrets") as secrets, \
+                mock.patch("agora_token_builder.AccessToken.time") as clock:
+            secrets.SystemRandom.return_value.randint.return_value = SALT
+            clock.time.return_value = NOW
+            return RtcTokenBuilder.buildTokenWithUid(
+                APP_ID, APP_CERTIFICATE, channel, uid, role, EXPIRE_TS
+            )
+
+    def test_build_matches_reference(self):
+        for role in ROLES:
+            for channel, uid in CASES:
+                with self.subTest(role=role, channel=channel, uid=uid):
+                    self.assertEqual(
+                        self.builder.build(
+                            channel, uid, role, EXPIRE_TS,
+                            salt=SALT, ts=NOW + MESSAGE_TS_OFFSET,
+                        ),
+                        self.reference(channel, uid, role),
+                    )
+
+    def test_build_many_matches_reference(self):
+        requests = [(channel, uid, role) for role in ROLES for channel, uid in CASES]
+
+        # build_many draws salt % MAX_SALT + 1 from one urandom call
+        entropy = struct.pack(f"<{len(requests)}I", *[SALT - 1] * len(requests))
+        with mock.patch("streaming.rtc_tokens.os.urandom", return_value=entropy):
+            tokens = self.builder.build_many(
+                requests, EXPIRE_TS, ts=NOW + MESSAGE_TS_OFFSET
+            )
+
+        self.assertLess(SALT, MAX_SALT)
+        self.assertEqual(
+            tokens,
+            [self.reference(channel, uid, role) for channel, uid, role in requests],
+        )
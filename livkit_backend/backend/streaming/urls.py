@@ -4,7 +4,9 @@ from .views import (
     JoinLiveStreamView,
     LeaveLiveStreamView,
     StreamHeartbeatView,
+    StreamerHeartbeatView,
     EndLiveStreamView,
+    SettlementStatusView,
     ActiveLiveStreamView,
 
     LiveFeedView,
@@ -18,10 +20,18 @@ urlpatterns = [
         "<uuid:stream_id>/heartbeat/",
         StreamHeartbeatView.as_view()
     ),
+    path(
+        "<uuid:stream_id>/streamer-heartbeat/",
+        StreamerHeartbeatView.as_view()
+    ),
     path(
         "<uuid:stream_id>/end/",
         EndLiveStreamView.as_view(),
     ),
+    path(
+        "<uuid:stream_id>/settlement/",
+        SettlementStatusView.as_view(),
+    ),
     path("active/", ActiveLiveStreamView.as_view(), name="active_live_stream"),
     path("feed/", LiveFeedView.as_view(), name="live_feed"),
 
@@ -9,18 +9,21 @@ from agora_token_builder import RtcTokenBuilder
 
 from .models import LiveStream, LiveViewSession
 from .serializers import LiveStreamSerializer
-from .agora import generate_agora_token
+from .agora import get_agora_token
+from .feed import feed_items, get_snapshot, invalidate_feed
+from .pagination import FeedCursorPagination
 from django.db.models import Q
-from .models import FallbackVideo
 from django.db import transaction
-from django.db.models import F
 
-MIN_PAYABLE_MINUTES = 2
+from django.conf import settings
+
+from . import heartbeats
+from .heartbeats import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, STREAMER_HEARTBEAT_INTERVAL
+from .settlement import MIN_PAYABLE_MINUTES, end_stream, settle_stream
+from .tasks import settle_ended_stream
 
 
 
-HEARTBEAT_INTERVAL = 30  # seconds
-HEARTBEAT_TIMEOUT = 60   # seconds
 
 
 AGORA_ROLE_PUBLISHER = 1
@@ -44,7 +47,7 @@ class CreateLiveStreamView(APIView):
         )
 
         try:
-            token = generate_agora_token(
+            token = get_agora_token(
                 channel_name=channel_name,
                 uid=0,
                 role=AGORA_ROLE_PUBLISHER
@@ -57,6 +60,9 @@ class CreateLiveStreamView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        # New live stream: feed snapshot rebuilds on next request
+        invalidate_feed()
+
         try:
             stream_data = LiveStreamSerializer(stream).data
         except Exception as e:
@@ -68,6 +74,7 @@ class CreateLiveStreamView(APIView):
                 "stream": stream_data,
                 "agora_token": token,
                 "channel_name": channel_name,
+                "heartbeat_interval": STREAMER_HEARTBEAT_INTERVAL,
             },
             status=status.HTTP_201_CREATED
         )
@@ -95,6 +102,7 @@ class LeaveLiveStreamView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        heartbeats.take_buffered(session)
         session.force_end(reason="viewer_left")
 
         minutes = session.active_seconds // 60
@@ -138,6 +146,32 @@ class StreamHeartbeatView(APIView):
     def post(self, request, stream_id):
         user = request.user
 
+        # ✅ Buffered mode: no DB read/write per heartbeat
+        if heartbeats.is_enabled():
+            outcome, active_seconds = heartbeats.record_heartbeat(
+                stream_id,
+                user.id,
+                interval=HEARTBEAT_INTERVAL,
+                timeout=HEARTBEAT_TIMEOUT,
+            )
+            if outcome == heartbeats.NO_SESSION:
+                return Response(
+                    {"detail": "No active session"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if outcome == heartbeats.EXPIRED:
+                return Response(
+                    {"detail": "Session expired"},
+                    status=status.HTTP_410_GONE
+                )
+            return Response(
+                {
+                    "status": "ok",
+                    "active_seconds": active_seconds,
+                },
+                status=status.HTTP_200_OK
+            )
+
         try:
             session = LiveViewSession.objects.get(
                 stream_id=stream_id,
@@ -174,6 +208,34 @@ class StreamHeartbeatView(APIView):
         )
 
 
+class StreamerHeartbeatView(APIView):
+    """
+    Streamer keeps the stream alive; one UPDATE, no row loaded.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, stream_id):
+        updated = LiveStream.objects.filter(
+            id=stream_id,
+            streamer=request.user,
+            is_live=True
+        ).update(last_heartbeat=timezone.now())
+
+        if not updated:
+            return Response(
+                {"detail": "Stream not found or already ended"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(
+            {
+                "status": "ok",
+                "heartbeat_interval": STREAMER_HEARTBEAT_INTERVAL,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
 class EndLiveStreamView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -194,52 +256,83 @@ class EndLiveStreamView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # End stream
-            stream.is_live = False
-            stream.ended_at = timezone.now()
-            stream.save(update_fields=["is_live", "ended_at"])
+            # End stream now; viewers are settled below (or by a worker)
+            end_stream(stream)
+            invalidate_feed()
 
-            active_sessions = LiveViewSession.objects.select_for_update().filter(
+            viewers = LiveViewSession.objects.filter(
                 stream=stream,
                 is_active=True
-            )
+            ).count()
 
-            total_earnings = Decimal("0.00")
+            threshold = settings.STREAM_SETTLEMENT_ASYNC_THRESHOLD
+            in_background = bool(threshold) and viewers > threshold
 
-            for session in active_sessions:
+            if in_background:
+                transaction.on_commit(
+                    lambda: settle_ended_stream.delay(str(stream.id))
+                )
 
-                session.force_end(reason="stream_ended")
+        if in_background:
+            return Response(
+                {
+                    "detail": "Live stream ended",
+                    "settlement": "pending",
+                    "total_views": stream.total_views,
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
 
-                minutes = session.active_seconds // 60
-                session.minutes_watched = minutes
+        settle_stream(stream.id)
+        stream.refresh_from_db()
 
-                earnings = Decimal("0.00")
+        return Response(
+            {
+                "detail": "Live stream ended",
+                "settlement": "settled",
+                "total_earnings": stream.total_earnings,
+                "total_views": stream.total_views,
+            },
+            status=status.HTTP_200_OK
+        )
 
-                if minutes >= MIN_PAYABLE_MINUTES:
-                    pay_per_minute = Decimal(str(random.uniform(0.05, 0.20)))
-                    earnings = Decimal(minutes) * pay_per_minute
 
-                session.earnings_generated = earnings
-                session.save(update_fields=["is_active", "ended_at", "minutes_watched", "earnings_generated"])
+class SettlementStatusView(APIView):
+    """
+    Streamer polls this after ending a stream with a 202.
+    """
+    permission_classes = [IsAuthenticated]
 
-                total_earnings += earnings
+    def get(self, request, stream_id):
+        stream = LiveStream.objects.filter(
+            id=stream_id,
+            streamer=request.user
+        ).only("is_live", "settled_at", "total_earnings", "total_views").first()
 
-            # Atomic earnings update
-            stream.total_earnings = F("total_earnings") + total_earnings
-            stream.save(update_fields=["total_earnings"])
-            stream.refresh_from_db()
+        if stream is None:
+            return Response(
+                {"detail": "Stream not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-            print(f"[DEBUG] Stream {stream.id} ended. Earnings: {stream.total_earnings}")
+        if stream.is_live:
+            settlement = "live"
+        elif stream.settled_at is None:
+            settlement = "pending"
+        else:
+            settlement = "settled"
 
         return Response(
             {
-                "detail": "Live stream ended",
-                "total_earnings": stream.total_earnings,
+                "settlement": settlement,
+                "settled_at": stream.settled_at,
+                "total_earnings": stream.total_earnings if settlement == "settled" else None,
                 "total_views": stream.total_views,
             },
             status=status.HTTP_200_OK
         )
 
+
 class JoinLiveStreamView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -270,12 +363,13 @@ class JoinLiveStreamView(APIView):
             stream=stream,
             viewer=user
         )
+        heartbeats.track_session(session)
 
         stream.total_views += 1
         stream.save(update_fields=["total_views"])
 
         try:
-            token = generate_agora_token(
+            token = get_agora_token(
                 channel_name=stream.channel_name,
                 uid=user.id,
                 role=AGORA_ROLE_SUBSCRIBER
@@ -302,45 +396,41 @@ class ActiveLiveStreamView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        active_streams = LiveStream.objects.filter(is_live=True).order_by("-started_at")
-        serializer = LiveStreamSerializer(active_streams, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # ✅ Shared snapshot: no per-request stream queries
+        snapshot = get_snapshot()
 
-class LiveFeedView(APIView):
-    permission_classes = [IsAuthenticated]
+        paginator = FeedCursorPagination()
+        page = paginator.paginate(snapshot, request)
+        if page is None:
+            return Response(
+                feed_items(snapshot, 0, None, with_tokens=False),
+                status=status.HTTP_200_OK
+            )
 
-    def get(self, request):
-        user = request.user
+        return Response(
+            {
+                "results": feed_items(snapshot, *page, with_tokens=False),
+                "next": paginator.get_next_link(),
+            },
+            status=status.HTTP_200_OK
+        )
 
-        live_streams = LiveStream.objects.filter(
-            is_live=True
-        ).order_by("-started_at")
 
-        live_data = []
+class LiveFeedView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        for stream in live_streams:
-            serialized = LiveStreamSerializer(stream).data
+    def get(self, request):
+        # ✅ Same snapshot for every viewer (preview tokens are uid 0)
+        snapshot = get_snapshot()
 
-            # 🔥 Generate PREVIEW subscriber token
-            preview_token = generate_agora_token(
-                channel_name=stream.channel_name,
-                uid=0,
-                role=AGORA_ROLE_SUBSCRIBER
-            )
+        paginator = FeedCursorPagination()
+        page = paginator.paginate(snapshot, request) or (0, None)
 
-            serialized["agora_token"] = preview_token
-            live_data.append(serialized)
+        response = {
+            "live_streams": feed_items(snapshot, *page),
+            "fallbacks": snapshot["fallbacks"],
+        }
+        if "cursor" in request.query_params or "page_size" in request.query_params:
+            response["next"] = paginator.get_next_link()
 
-        fallback_videos = [
-            {
-                "type": "fallback",
-                "title": video.title,
-                "video_url": video.video_url,
-            }
-            for video in FallbackVideo.objects.filter(is_active=True)
-        ]
-
-        return Response({
-            "live_streams": live_data,
-            "fallbacks": fallback_videos,
-        })
+        return Response(response)